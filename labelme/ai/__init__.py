@@ -1,87 +1,49 @@
-import gdown
+import os.path as osp
 
 from .efficient_sam import EfficientSam
+from .embedding_cache import EmbeddingCache  # NOQA
+from .embedding_cache import create_embedding_cache  # NOQA
 from .segment_anything_model import SegmentAnythingModel
 
 
 class SegmentAnythingModelVitB(SegmentAnythingModel):
     name = "SegmentAnything (speed)"
-
-    def __init__(self):
-        super().__init__(
-            encoder_path=gdown.cached_download(
-                url="https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_b_01ec64.quantized.encoder.onnx",  # NOQA
-                md5="80fd8d0ab6c6ae8cb7b3bd5f368a752c",
-            ),
-            decoder_path=gdown.cached_download(
-                url="https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_b_01ec64.quantized.decoder.onnx",  # NOQA
-                md5="4253558be238c15fc265a7a876aaec82",
-            ),
-        )
+    encoder_url = "https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_b_01ec64.quantized.encoder.onnx"  # NOQA
+    encoder_md5 = "80fd8d0ab6c6ae8cb7b3bd5f368a752c"
+    decoder_url = "https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_b_01ec64.quantized.decoder.onnx"  # NOQA
+    decoder_md5 = "4253558be238c15fc265a7a876aaec82"
 
 
 class SegmentAnythingModelVitL(SegmentAnythingModel):
     name = "SegmentAnything (balanced)"
-
-    def __init__(self):
-        super().__init__(
-            encoder_path=gdown.cached_download(
-                url="https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_l_0b3195.quantized.encoder.onnx",  # NOQA
-                md5="080004dc9992724d360a49399d1ee24b",
-            ),
-            decoder_path=gdown.cached_download(
-                url="https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_l_0b3195.quantized.decoder.onnx",  # NOQA
-                md5="851b7faac91e8e23940ee1294231d5c7",
-            ),
-        )
+    encoder_url = "https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_l_0b3195.quantized.encoder.onnx"  # NOQA
+    encoder_md5 = "080004dc9992724d360a49399d1ee24b"
+    decoder_url = "https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_l_0b3195.quantized.decoder.onnx"  # NOQA
+    decoder_md5 = "851b7faac91e8e23940ee1294231d5c7"
 
 
 class SegmentAnythingModelVitH(SegmentAnythingModel):
     name = "SegmentAnything (accuracy)"
-
-    def __init__(self):
-        super().__init__(
-            encoder_path=gdown.cached_download(
-                url="https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_h_4b8939.quantized.encoder.onnx",  # NOQA
-                md5="958b5710d25b198d765fb6b94798f49e",
-            ),
-            decoder_path=gdown.cached_download(
-                url="https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_h_4b8939.quantized.decoder.onnx",  # NOQA
-                md5="a997a408347aa081b17a3ffff9f42a80",
-            ),
-        )
+    encoder_url = "https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_h_4b8939.quantized.encoder.onnx"  # NOQA
+    encoder_md5 = "958b5710d25b198d765fb6b94798f49e"
+    decoder_url = "https://github.com/wkentaro/labelme/releases/download/sam-20230416/sam_vit_h_4b8939.quantized.decoder.onnx"  # NOQA
+    decoder_md5 = "a997a408347aa081b17a3ffff9f42a80"
 
 
 class EfficientSamVitT(EfficientSam):
     name = "EfficientSam (speed)"
-
-    def __init__(self):
-        super().__init__(
-            encoder_path=gdown.cached_download(
-                url="https://github.com/labelmeai/efficient-sam/releases/download/onnx-models-20231225/efficient_sam_vitt_encoder.onnx",  # NOQA
-                md5="2d4a1303ff0e19fe4a8b8ede69c2f5c7",
-            ),
-            decoder_path=gdown.cached_download(
-                url="https://github.com/labelmeai/efficient-sam/releases/download/onnx-models-20231225/efficient_sam_vitt_decoder.onnx",  # NOQA
-                md5="be3575ca4ed9b35821ac30991ab01843",
-            ),
-        )
+    encoder_url = "https://github.com/labelmeai/efficient-sam/releases/download/onnx-models-20231225/efficient_sam_vitt_encoder.onnx"  # NOQA
+    encoder_md5 = "2d4a1303ff0e19fe4a8b8ede69c2f5c7"
+    decoder_url = "https://github.com/labelmeai/efficient-sam/releases/download/onnx-models-20231225/efficient_sam_vitt_decoder.onnx"  # NOQA
+    decoder_md5 = "be3575ca4ed9b35821ac30991ab01843"
 
 
 class EfficientSamVitS(EfficientSam):
     name = "EfficientSam (accuracy)"
-
-    def __init__(self):
-        super().__init__(
-            encoder_path=gdown.cached_download(
-                url="https://github.com/labelmeai/efficient-sam/releases/download/onnx-models-20231225/efficient_sam_vits_encoder.onnx",  # NOQA
-                md5="7d97d23e8e0847d4475ca7c9f80da96d",
-            ),
-            decoder_path=gdown.cached_download(
-                url="https://github.com/labelmeai/efficient-sam/releases/download/onnx-models-20231225/efficient_sam_vits_decoder.onnx",  # NOQA
-                md5="d9372f4a7bbb1a01d236b0508300b994",
-            ),
-        )
+    encoder_url = "https://github.com/labelmeai/efficient-sam/releases/download/onnx-models-20231225/efficient_sam_vits_encoder.onnx"  # NOQA
+    encoder_md5 = "7d97d23e8e0847d4475ca7c9f80da96d"
+    decoder_url = "https://github.com/labelmeai/efficient-sam/releases/download/onnx-models-20231225/efficient_sam_vits_decoder.onnx"  # NOQA
+    decoder_md5 = "d9372f4a7bbb1a01d236b0508300b994"
 
 
 MODELS = [
@@ -91,3 +53,35 @@ MODELS = [
     EfficientSamVitT,
     EfficientSamVitS,
 ]
+
+
+def get_models(models_config=None):
+    """Return MODELS with the models of the `ai.models` config.
+
+    A model in the config with the name of one in MODELS replaces it with
+    its local files, and one with another name is added as a model of
+    `type`, which is SegmentAnythingModel or EfficientSam.
+    """
+    models = list(MODELS)
+    for model_config in models_config or []:
+        model_names = [model.name for model in models]
+        if model_config["name"] in model_names:
+            index = model_names.index(model_config["name"])
+            base = models[index]
+        else:
+            index = len(models)
+            models.append(None)
+            base = {
+                "SegmentAnythingModel": SegmentAnythingModel,
+                "EfficientSam": EfficientSam,
+            }[model_config["type"]]
+        models[index] = type(
+            base.__name__,
+            (base,),
+            dict(
+                name=model_config["name"],
+                encoder_path=osp.expanduser(model_config["encoder_path"]),
+                decoder_path=osp.expanduser(model_config["decoder_path"]),
+            ),
+        )
+    return models
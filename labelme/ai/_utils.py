@@ -1,9 +1,127 @@
+import hashlib
+import os
+import os.path as osp
+import platform
+import uuid
+
 import imgviz
 import numpy as np
-import skimage
 
 from labelme.logger import logger
 
+# onnxruntime, skimage and gdown are imported when used, as they are slow to
+# import and not needed until an AI model is used.
+
+_GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def download_model(url, md5):
+    import gdown
+
+    return gdown.cached_download(url=url, md5=md5)
+
+
+def _get_graph_optimization_level(name):
+    import onnxruntime
+
+    return getattr(onnxruntime.GraphOptimizationLevel, _GRAPH_OPTIMIZATION_LEVELS[name])
+
+
+def _get_optimized_model_path(model_path, config):
+    import onnxruntime
+
+    cache_dir = config["optimized_model_dir"]
+    if cache_dir is None:
+        cache_dir = "~/.cache/labelme/onnx"
+    stat = os.stat(model_path)
+    # the optimized graph depends on the runtime and the hardware
+    key = repr(
+        (
+            osp.abspath(model_path),
+            stat.st_size,
+            stat.st_mtime_ns,
+            config["graph_optimization_level"],
+            config["providers"],
+            onnxruntime.__version__,
+            platform.machine(),
+        )
+    )
+    return osp.join(
+        osp.expanduser(cache_dir),
+        "{}.{}.onnx".format(
+            osp.splitext(osp.basename(model_path))[0],
+            hashlib.sha1(key.encode()).hexdigest()[:16],
+        ),
+    )
+
+
+def create_inference_session(model_path, config=None):
+    """Return onnxruntime.InferenceSession with the `ai.session` config.
+
+    If config["optimized_model_cache"] is true, the graph optimized at the
+    first time is saved and loaded at the next time, skipping optimization.
+    """
+    import onnxruntime
+
+    if config is None:
+        return onnxruntime.InferenceSession(model_path)
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = config["intra_op_num_threads"]
+    options.inter_op_num_threads = config["inter_op_num_threads"]
+    options.graph_optimization_level = _get_graph_optimization_level(
+        config["graph_optimization_level"]
+    )
+    options.enable_cpu_mem_arena = config["enable_cpu_mem_arena"]
+    options.enable_mem_pattern = config["enable_mem_pattern"]
+
+    if (
+        not config["optimized_model_cache"]
+        or config["graph_optimization_level"] == "disable"
+    ):
+        return onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=config["providers"]
+        )
+
+    optimized_model_path = _get_optimized_model_path(model_path, config)
+    if osp.exists(optimized_model_path):
+        options.graph_optimization_level = _get_graph_optimization_level("disable")
+        try:
+            return onnxruntime.InferenceSession(
+                optimized_model_path,
+                sess_options=options,
+                providers=config["providers"],
+            )
+        except Exception as e:
+            logger.warning(
+                "Failed to load optimized model {!r}: {}".format(
+                    optimized_model_path, e
+                )
+            )
+            options.graph_optimization_level = _get_graph_optimization_level(
+                config["graph_optimization_level"]
+            )
+
+    os.makedirs(osp.dirname(optimized_model_path), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(optimized_model_path, uuid.uuid4().hex[:8])
+    options.optimized_model_filepath = tmp_path
+    try:
+        session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=config["providers"]
+        )
+        if osp.exists(tmp_path):
+            os.replace(tmp_path, optimized_model_path)
+            logger.debug("Saved optimized model: {!r}".format(optimized_model_path))
+    finally:
+        if osp.exists(tmp_path):
+            os.remove(tmp_path)
+    return session
+
 
 def _get_contour_length(contour):
     contour_start = contour
@@ -11,13 +129,68 @@ def _get_contour_length(contour):
     return np.linalg.norm(contour_end - contour_start, axis=1).sum()
 
 
+def quantize_prompt(points, point_labels):
+    """Return points rounded to pixels and labels as hashable tuples."""
+    points = tuple((int(round(x)), int(round(y))) for x, y in points)
+    point_labels = tuple(int(label) for label in point_labels)
+    return points, point_labels
+
+
+def downscale_image(image, max_size):
+    """Return image resized so that its longer side is at most max_size."""
+    height, width = image.shape[:2]
+    if max_size is None or max(height, width) <= max_size:
+        return image
+    scale = max_size / max(height, width)
+    return imgviz.resize(
+        image,
+        height=max(1, int(round(height * scale))),
+        width=max(1, int(round(width * scale))),
+        backend="pillow",
+    )
+
+
+def scale_points(points, scale):
+    """Return points in an image resized by scale (x, y) of the image.
+
+    The scale is applied around pixel centers, so that the center of a pixel
+    is mapped to the center of the pixel it is resized to.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if tuple(scale) == (1, 1):
+        return points
+    return (points + 0.5) * scale - 0.5
+
+
+def resize_mask(mask, shape):
+    """Return mask resized to shape (height, width) by nearest neighbor."""
+    height, width = shape
+    if mask.shape == (height, width):
+        return mask
+    rows = ((np.arange(height) + 0.5) * (mask.shape[0] / height)).astype(int)
+    cols = ((np.arange(width) + 0.5) * (mask.shape[1] / width)).astype(int)
+    return mask[rows[:, None], cols[None, :]]
+
+
 def compute_polygon_from_mask(mask):
-    contours = skimage.measure.find_contours(np.pad(mask, pad_width=1))
-    if len(contours) == 0:
+    import skimage.measure
+
+    # contours are found in the bounding box of the mask, which is usually much
+    # smaller than the image
+    rows = np.flatnonzero(mask.any(axis=1))
+    if len(rows) == 0:
         logger.warning("No contour found, so returning empty polygon.")
         return np.empty((0, 2), dtype=np.float32)
+    cols = np.flatnonzero(mask.any(axis=0))
+    y1, y2, x1, x2 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
 
+    # padded so that the contours are closed at the edges of the bounding box
+    contours = skimage.measure.find_contours(
+        np.pad(mask[y1:y2, x1:x2], pad_width=1), level=0.5
+    )
     contour = max(contours, key=_get_contour_length)
+    contour += (y1 - 1, x1 - 1)
+
     POLYGON_APPROX_TOLERANCE = 0.004
     polygon = skimage.measure.approximate_polygon(
         coords=contour,
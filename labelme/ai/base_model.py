@@ -0,0 +1,397 @@
+import collections
+import hashlib
+import os
+import os.path as osp
+import threading
+
+import numpy as np
+
+from ..logger import logger
+from . import _utils
+from .embedding_cache import compute_image_key
+
+
+class BaseModel:
+    """Base of promptable segmentation models of an encoder and a decoder.
+
+    It computes the image embedding in background and predicts masks and
+    polygons from prompts with it. Subclasses implement `_encode_image` and
+    `_decode_masks` with their ONNX sessions.
+    """
+
+    name = None
+    # model files, which are downloaded from the urls if the paths are None
+    encoder_path = None
+    encoder_url = None
+    encoder_md5 = None
+    decoder_path = None
+    decoder_url = None
+    decoder_md5 = None
+
+    def __init__(
+        self,
+        encoder_path=None,
+        decoder_path=None,
+        embedding_cache=None,
+        session_config=None,
+        max_image_size=None,
+    ):
+        # the files are downloaded and loaded at first use
+        self._encoder_path = encoder_path or self.encoder_path
+        self._decoder_path = decoder_path or self.decoder_path
+        self._session_config = session_config
+        self._session_lock = threading.Lock()
+        self._sessions = None
+
+        self._condition = threading.Condition()
+        self._image_embedding_cache = collections.OrderedDict()
+        self._embedding_cache = embedding_cache
+        self._embedding_cache_name = self._get_embedding_cache_name()
+        # larger images are downscaled, and prompts and predictions are mapped
+        # between the original and downscaled images
+        self._max_image_size = max_image_size
+
+        # a single worker computes the embedding of the current image, or else
+        # of prefetched images, and drops the requests superseded before run
+        self._image_key = None
+        self._image_embedding = None
+        self._request = None  # (image_key, image)
+        self._prefetch_requests = collections.OrderedDict()  # image_key: image
+        self._computing_key = None
+        self._worker = None
+        self._closed = False
+
+        self._prediction_lock = threading.Lock()
+        self._prediction_cache = collections.OrderedDict()
+
+    @property
+    def max_image_size(self):
+        """Longer side beyond which images are downscaled, or None."""
+        return self._max_image_size
+
+    def _get_embedding_cache_name(self):
+        # the encoder is identified in addition to the name, so that another
+        # encoder given the same name does not get the cached embeddings
+        if self._encoder_path is None:
+            identity = self.encoder_md5
+        else:
+            try:
+                stat = os.stat(self._encoder_path)
+                identity = repr(
+                    (
+                        osp.abspath(self._encoder_path),
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    )
+                )
+            except OSError:
+                identity = repr(osp.abspath(self._encoder_path))
+        return "{}.{}".format(
+            self.name or osp.basename(self._encoder_path),
+            hashlib.sha1(str(identity).encode()).hexdigest()[:16],
+        )
+
+    def _get_sessions(self):
+        with self._session_lock:
+            if self._sessions is None:
+                encoder_path = self._encoder_path or _utils.download_model(
+                    url=self.encoder_url, md5=self.encoder_md5
+                )
+                decoder_path = self._decoder_path or _utils.download_model(
+                    url=self.decoder_url, md5=self.decoder_md5
+                )
+                self._sessions = (
+                    _utils.create_inference_session(
+                        encoder_path, config=self._session_config
+                    ),
+                    _utils.create_inference_session(
+                        decoder_path, config=self._session_config
+                    ),
+                )
+            return self._sessions
+
+    @property
+    def _encoder_session(self):
+        return self._get_sessions()[0]
+
+    @property
+    def _decoder_session(self):
+        return self._get_sessions()[1]
+
+    def _encode_image(self, image):
+        """Return the image embedding of the image."""
+        raise NotImplementedError
+
+    def _decode_masks(self, image, image_embedding, prompts):
+        """Return masks of the image size from prompts in the image."""
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Load the model and run the decoder once, as its first run is slow."""
+        _, decoder_session = self._get_sessions()
+        embedding_shape = {
+            node.name: node.shape for node in decoder_session.get_inputs()
+        }["image_embeddings"]
+        self._decode_masks(
+            image=np.zeros((64, 64, 3), dtype=np.uint8),
+            image_embedding=np.zeros(
+                [dim if isinstance(dim, int) else 1 for dim in embedding_shape],
+                dtype=np.float32,
+            ),
+            prompts=[([[0, 0]], [1])],
+        )
+
+    def set_image(self, image: np.ndarray, original_shape=None):
+        """Set the image, which is downscaled if larger than max_image_size.
+
+        The image may be given already downscaled from original_shape
+        (height, width), in whose coordinates prompts and predictions are.
+        """
+        if original_shape is None:
+            original_shape = image.shape[:2]
+        image = _utils.downscale_image(image, max_size=self._max_image_size)
+        image_key = compute_image_key(image)
+        with self._condition:
+            self._image = image
+            self._image_key = image_key
+            self._original_shape = tuple(original_shape)
+            self._image_scale = (
+                image.shape[1] / original_shape[1],
+                image.shape[0] / original_shape[0],
+            )
+            self._image_embedding = self._image_embedding_cache.get(self._image_key)
+            if self._image_embedding is None and self._embedding_cache is not None:
+                self._image_embedding = self._embedding_cache.get(
+                    self._embedding_cache_name, self._image_key
+                )
+
+            self._request = None
+            if self._image_embedding is None and image_key != self._computing_key:
+                self._prefetch_requests.pop(image_key, None)
+                self._request = (image_key, image)
+                self._start_worker()
+
+    def prefetch_image(self, image: np.ndarray):
+        """Compute the image embedding in background for a later set_image.
+
+        It is computed after the embedding of the current image, and only the
+        latest few requests are kept.
+        """
+        image = _utils.downscale_image(image, max_size=self._max_image_size)
+        image_key = compute_image_key(image)
+        with self._condition:
+            if image_key in self._image_embedding_cache or self._is_computing(
+                image_key
+            ):
+                return
+            self._prefetch_requests[image_key] = image
+            self._prefetch_requests.move_to_end(image_key)
+            while len(self._prefetch_requests) > 4:
+                self._prefetch_requests.popitem(last=False)
+            self._start_worker()
+
+    def _is_computing(self, image_key):
+        # called with self._condition acquired
+        return image_key == self._computing_key or (
+            self._request is not None and self._request[0] == image_key
+        )
+
+    def close(self):
+        """Stop the embedding worker and release the sessions.
+
+        The model cannot compute image embeddings after closed.
+        """
+        with self._condition:
+            self._closed = True
+            self._request = None
+            self._prefetch_requests.clear()
+            self._condition.notify_all()
+            worker = self._worker
+        # the worker finishes the embedding in progress, if any
+        if worker is not None and worker is not threading.current_thread():
+            worker.join()
+        with self._session_lock:
+            self._sessions = None
+
+    def _start_worker(self):
+        # called with self._condition acquired
+        if self._closed:
+            # dropped, so that nothing waits for them
+            self._request = None
+            self._prefetch_requests.clear()
+            return
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run_worker, daemon=True)
+            self._worker.start()
+        self._condition.notify_all()
+
+    def _run_worker(self):
+        while True:
+            with self._condition:
+                while (
+                    not self._closed
+                    and self._request is None
+                    and not self._prefetch_requests
+                ):
+                    self._condition.wait()
+                if self._closed:
+                    self._worker = None
+                    return
+                if self._request is not None:
+                    image_key, image = self._request
+                    self._request = None
+                    is_prefetch = False
+                else:
+                    image_key, image = self._prefetch_requests.popitem(last=False)
+                    is_prefetch = True
+                self._computing_key = image_key
+
+            image_embedding = None
+            if is_prefetch and self._embedding_cache is not None:
+                image_embedding = self._embedding_cache.get(
+                    self._embedding_cache_name, image_key
+                )
+            is_computed = image_embedding is None
+            if is_computed:
+                logger.debug("Computing image embedding...")
+                try:
+                    image_embedding = self._encode_image(image)
+                except Exception as e:
+                    logger.error("Failed to compute image embedding: {}".format(e))
+                else:
+                    logger.debug("Done computing image embedding.")
+
+            # stored before the waiters are notified, so that the embedding is
+            # on disk when a script exits after waiting for it
+            if (
+                is_computed
+                and image_embedding is not None
+                and self._embedding_cache is not None
+            ):
+                try:
+                    self._embedding_cache.put(
+                        self._embedding_cache_name, image_key, image_embedding
+                    )
+                except OSError as e:
+                    logger.warning("Failed to cache image embedding: {}".format(e))
+
+            with self._condition:
+                self._computing_key = None
+                if image_embedding is not None:
+                    if len(self._image_embedding_cache) > 10:
+                        self._image_embedding_cache.popitem(last=False)
+                    self._image_embedding_cache[image_key] = image_embedding
+                    if image_key == self._image_key:
+                        self._image_embedding = image_embedding
+                self._condition.notify_all()
+
+    def _get_image_embedding(self, image_key=None):
+        # waits for the embedding of the image, which is the current one if
+        # not given, and returns None if it is not computed
+        with self._condition:
+            if image_key is None:
+                image_key = self._image_key
+            if image_key == self._image_key:
+                image_embedding = self._image_embedding
+            else:
+                image_embedding = self._image_embedding_cache.get(image_key)
+            while image_embedding is None and self._is_computing(image_key):
+                self._condition.wait()
+                image_embedding = self._image_embedding_cache.get(image_key)
+            return image_embedding
+
+    def wait_image_embedding(self):
+        """Wait for the embedding of the current image, and return it.
+
+        None is returned if it failed to be computed.
+        """
+        return self._get_image_embedding()
+
+    def _get_predictions(self, prompts):
+        # the image is taken at once, so that a set_image from another thread
+        # does not mix up two images in a prediction
+        with self._condition:
+            image_key = self._image_key
+            image = self._image
+            original_shape = self._original_shape
+            image_scale = self._image_scale
+        # points are quantized to pixels, so hovering within a pixel or
+        # repainting reuses the prediction
+        keys = [
+            (image_key, original_shape) + _utils.quantize_prompt(points, point_labels)
+            for points, point_labels in prompts
+        ]
+        predictions = {}
+        with self._prediction_lock:
+            for key in keys:
+                if key in self._prediction_cache:
+                    self._prediction_cache.move_to_end(key)
+                    predictions[key] = self._prediction_cache[key]
+        missing_keys = [key for key in dict.fromkeys(keys) if key not in predictions]
+        if missing_keys:
+            image_embedding = self._get_image_embedding(image_key)
+            if image_embedding is None:
+                raise RuntimeError("Image embedding is not available")
+            masks = self._decode_masks(
+                image=image,
+                image_embedding=image_embedding,
+                prompts=[
+                    (_utils.scale_points(points, image_scale), list(point_labels))
+                    for _, _, points, point_labels in missing_keys
+                ],
+            )
+            with self._prediction_lock:
+                for key, mask in zip(missing_keys, masks):
+                    # the cached arrays are returned without copying, so they
+                    # are made read-only not to be modified by the callers
+                    mask.setflags(write=False)
+                    predictions[key] = {
+                        "mask": mask,
+                        "polygon": None,
+                        "shape": original_shape,
+                        "scale": image_scale,
+                    }
+                    self._prediction_cache[key] = predictions[key]
+                # the masks are of the image size, so fewer are kept for large
+                # images, but at least the latest one
+                while len(self._prediction_cache) > 1 and (
+                    len(self._prediction_cache) > 32
+                    or sum(
+                        prediction["mask"].nbytes
+                        for prediction in self._prediction_cache.values()
+                    )
+                    > 64 * 1024**2
+                ):
+                    self._prediction_cache.popitem(last=False)
+        return [predictions[key] for key in keys]
+
+    def _get_prediction(self, points, point_labels):
+        return self._get_predictions(prompts=[(points, point_labels)])[0]
+
+    def predict_mask_from_points(self, points, point_labels):
+        prediction = self._get_prediction(points=points, point_labels=point_labels)
+        return _utils.resize_mask(prediction["mask"], shape=prediction["shape"])
+
+    def predict_masks_from_prompts(self, prompts):
+        """Return masks predicted from prompts of (points, point_labels).
+
+        A box is given as its top-left and bottom-right points labeled 2 and
+        3. The prompts share the image embedding, and are decoded at once if
+        the decoder takes multiple prompts.
+        """
+        return [
+            _utils.resize_mask(prediction["mask"], shape=prediction["shape"])
+            for prediction in self._get_predictions(prompts=prompts)
+        ]
+
+    def predict_polygon_from_points(self, points, point_labels):
+        prediction = self._get_prediction(points=points, point_labels=point_labels)
+        if prediction["polygon"] is None:
+            polygon = _utils.compute_polygon_from_mask(mask=prediction["mask"])
+            scale_x, scale_y = prediction["scale"]
+            polygon = _utils.scale_points(polygon, (1 / scale_x, 1 / scale_y))
+            height, width = prediction["shape"]
+            polygon = np.clip(polygon, (0, 0), (width - 1, height - 1))
+            polygon.setflags(write=False)
+            prediction["polygon"] = polygon
+        return prediction["polygon"]
@@ -1,83 +1,100 @@
-import collections
-import threading
-
 import imgviz
 import numpy as np
-import onnxruntime
-import skimage
-
-from ..logger import logger
-from . import _utils
-
 
-class EfficientSam:
-    def __init__(self, encoder_path, decoder_path):
-        self._encoder_session = onnxruntime.InferenceSession(encoder_path)
-        self._decoder_session = onnxruntime.InferenceSession(decoder_path)
+from .base_model import BaseModel
 
-        self._lock = threading.Lock()
-        self._image_embedding_cache = collections.OrderedDict()
 
-        self._thread = None
+class EfficientSam(BaseModel):
+    def __init__(self, *args, **kwargs):
+        super(EfficientSam, self).__init__(*args, **kwargs)
+        # reused while the image size is the same
+        self._input_buffer = None
 
-    def set_image(self, image: np.ndarray):
-        with self._lock:
-            self._image = image
-            self._image_embedding = self._image_embedding_cache.get(
-                self._image.tobytes()
-            )
+    def _encode_image(self, image):
+        self._input_buffer = _compute_batched_images(
+            image=image, out=self._input_buffer
+        )
+        (image_embedding,) = self._encoder_session.run(
+            output_names=None,
+            input_feed={"batched_images": self._input_buffer},
+        )
+        return image_embedding
 
-        if self._image_embedding is None:
-            self._thread = threading.Thread(
-                target=self._compute_and_cache_image_embedding
-            )
-            self._thread.start()
-
-    def _compute_and_cache_image_embedding(self):
-        with self._lock:
-            logger.debug("Computing image embedding...")
-            image = imgviz.rgba2rgb(self._image)
-            batched_images = image.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
-            (self._image_embedding,) = self._encoder_session.run(
-                output_names=None,
-                input_feed={"batched_images": batched_images},
-            )
-            if len(self._image_embedding_cache) > 10:
-                self._image_embedding_cache.popitem(last=False)
-            self._image_embedding_cache[self._image.tobytes()] = self._image_embedding
-            logger.debug("Done computing image embedding.")
-
-    def _get_image_embedding(self):
-        if self._thread is not None:
-            self._thread.join()
-            self._thread = None
-        with self._lock:
-            return self._image_embedding
-
-    def predict_mask_from_points(self, points, point_labels):
-        return _compute_mask_from_points(
+    def _decode_masks(self, image, image_embedding, prompts):
+        return _compute_masks_from_prompts(
             decoder_session=self._decoder_session,
-            image=self._image,
-            image_embedding=self._get_image_embedding(),
-            points=points,
-            point_labels=point_labels,
+            image=image,
+            image_embedding=image_embedding,
+            prompts=prompts,
         )
 
-    def predict_polygon_from_points(self, points, point_labels):
-        mask = self.predict_mask_from_points(points=points, point_labels=point_labels)
-        return _utils.compute_polygon_from_mask(mask=mask)
+
+def _compute_batched_images(image, out=None):
+    """Return the image scaled to [0, 1] as (1, 3, H, W) in out if given."""
+    height, width = image.shape[:2]
+    if out is None or out.shape != (1, 3, height, width):
+        out = np.empty((1, 3, height, width), dtype=np.float32)
+    image = imgviz.asrgb(image)
+    np.divide(image.transpose(2, 0, 1)[None], np.float32(255), out=out)
+    return out
 
 
 def _compute_mask_from_points(
     decoder_session, image, image_embedding, points, point_labels
 ):
-    input_point = np.array(points, dtype=np.float32)
-    input_label = np.array(point_labels, dtype=np.float32)
+    return _compute_masks_from_prompts(
+        decoder_session=decoder_session,
+        image=image,
+        image_embedding=image_embedding,
+        prompts=[(points, point_labels)],
+    )[0]
+
+
+_MAX_NUM_QUERIES = 4
+
+
+def _compute_masks_from_prompts(decoder_session, image, image_embedding, prompts):
+    import skimage.morphology
+
+    num_queries = {node.name: node.shape for node in decoder_session.get_inputs()}[
+        "batched_point_coords"
+    ][1]
+    if len(prompts) > 1 and isinstance(num_queries, int):
+        # the decoder is exported with a single query
+        return [
+            _compute_mask_from_points(
+                decoder_session=decoder_session,
+                image=image,
+                image_embedding=image_embedding,
+                points=points,
+                point_labels=point_labels,
+            )
+            for points, point_labels in prompts
+        ]
+
+    if len(prompts) > _MAX_NUM_QUERIES:
+        # the masks are output as (1, Q, 3, H, W) in float32, so prompts are
+        # decoded in chunks to bound the memory with many of them
+        return [
+            mask
+            for i in range(0, len(prompts), _MAX_NUM_QUERIES)
+            for mask in _compute_masks_from_prompts(
+                decoder_session=decoder_session,
+                image=image,
+                image_embedding=image_embedding,
+                prompts=prompts[i : i + _MAX_NUM_QUERIES],
+            )
+        ]
 
+    # prompts are padded with points labeled -1, which are ignored
+    num_points = max(len(points) for points, _ in prompts)
     # batch_size, num_queries, num_points, 2
-    batched_point_coords = input_point[None, None, :, :]
+    batched_point_coords = np.zeros((1, len(prompts), num_points, 2), dtype=np.float32)
     # batch_size, num_queries, num_points
-    batched_point_labels = input_label[None, None, :]
+    batched_point_labels = np.full((1, len(prompts), num_points), -1, dtype=np.float32)
+    for i, (points, point_labels) in enumerate(prompts):
+        batched_point_coords[0, i, : len(points)] = points
+        batched_point_labels[0, i, : len(point_labels)] = point_labels
 
     decoder_inputs = {
         "image_embeddings": image_embedding,
@@ -87,14 +104,14 @@ def _compute_mask_from_points(
     }
 
     masks, _, _ = decoder_session.run(None, decoder_inputs)
-    mask = masks[0, 0, 0, :, :]  # (1, 1, 3, H, W) -> (H, W)
-    mask = mask > 0.0
+    masks = masks[0, :, 0, :, :] > 0.0  # (1, Q, 3, H, W) -> (Q, H, W)
 
     MIN_SIZE_RATIO = 0.05
-    skimage.morphology.remove_small_objects(
-        mask, min_size=mask.sum() * MIN_SIZE_RATIO, out=mask
-    )
+    for mask in masks:
+        skimage.morphology.remove_small_objects(
+            mask, min_size=mask.sum() * MIN_SIZE_RATIO, out=mask
+        )
 
     if 0:
-        imgviz.io.imsave("mask.jpg", imgviz.label2rgb(mask, imgviz.rgb2gray(image)))
-    return mask
+        imgviz.io.imsave("mask.jpg", imgviz.label2rgb(masks[0], imgviz.rgb2gray(image)))
+    return list(masks)
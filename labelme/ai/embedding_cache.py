@@ -0,0 +1,133 @@
+import hashlib
+import os
+import os.path as osp
+import re
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+from ..logger import logger
+
+
+def compute_image_key(image: np.ndarray) -> str:
+    """Return the hex digest of the content of the image.
+
+    The buffer of the image is hashed in place without copying it. SHA-256
+    is used as it is hardware-accelerated on most CPUs, and is faster than
+    BLAKE2 there.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(str((image.shape, image.dtype.str)).encode())
+    hasher.update(np.ascontiguousarray(image).data)
+    return hasher.hexdigest()
+
+
+def create_embedding_cache(config):
+    """Return EmbeddingCache of the `ai.embedding_cache` config or None."""
+    if not config["enabled"]:
+        return None
+    cache_dir = config["dir"]
+    if cache_dir is None:
+        cache_dir = "~/.cache/labelme/embeddings"
+    return EmbeddingCache(
+        cache_dir=osp.expanduser(cache_dir), max_size=config["max_size"] * 2**20
+    )
+
+
+class EmbeddingCache(object):
+    """Image embeddings stored on disk as .npy files under cache_dir.
+
+    Embeddings are stored per model in `{cache_dir}/{model_name}/{key}.npy`,
+    so the embeddings of a model are invalidated by removing its directory.
+    Embeddings are read as memory-mapped arrays, and the least recently used
+    ones are removed when the total size exceeds max_size in bytes, which
+    is tracked in memory after the files are scanned once.
+    """
+
+    def __init__(self, cache_dir, max_size=2 * 2**30):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # total size of the files, which is scanned once and then tracked
+        self._size = None
+        self._size_lock = threading.Lock()
+
+    def _get_model_dir(self, model_name):
+        return osp.join(self.cache_dir, re.sub(r"[^\w.-]+", "_", model_name))
+
+    def _get_filename(self, model_name, key):
+        return osp.join(self._get_model_dir(model_name), key + ".npy")
+
+    def get(self, model_name, key):
+        """Return the memory-mapped embedding, or None if it is not cached."""
+        filename = self._get_filename(model_name, key)
+        try:
+            embedding = np.load(filename, mmap_mode="r")
+            os.utime(filename)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        logger.debug("Loaded image embedding from cache: {!r}".format(filename))
+        return embedding
+
+    def put(self, model_name, key, embedding):
+        filename = self._get_filename(model_name, key)
+        os.makedirs(osp.dirname(filename), exist_ok=True)
+        tmp_filename = "{}.{}.tmp".format(filename, uuid.uuid4().hex[:8])
+        try:
+            with open(tmp_filename, "wb") as f:
+                np.save(f, embedding)
+            file_size = os.stat(tmp_filename).st_size
+            try:
+                file_size -= os.stat(filename).st_size  # replaced
+            except OSError:
+                pass
+            os.replace(tmp_filename, filename)
+        finally:
+            if osp.exists(tmp_filename):
+                os.remove(tmp_filename)
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(entry[1] for entry in self._scan())
+            else:
+                self._size += file_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def invalidate(self, model_name):
+        """Remove all the embeddings of the model."""
+        shutil.rmtree(self._get_model_dir(model_name), ignore_errors=True)
+        with self._size_lock:
+            self._size = None  # scanned again on the next put
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.cache_dir) as model_dirs:
+            for model_dir in model_dirs:
+                if not model_dir.is_dir():
+                    continue
+                with os.scandir(model_dir.path) as files:
+                    for file in files:
+                        if file.name.endswith(".npy"):
+                            stat = file.stat()
+                            entries.append((stat.st_mtime, stat.st_size, file.path))
+        return entries
+
+    def _evict(self):
+        # the files are scanned again, as other processes may share the cache.
+        # some more are removed not to scan them on every put of a full cache
+        entries = self._scan()
+        size = sum(entry[1] for entry in entries)
+        if size <= self.max_size:
+            self._size = size
+            return
+        for _, file_size, filename in sorted(entries):
+            if size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            size -= file_size
+            logger.debug("Removed image embedding from cache: {!r}".format(filename))
+        self._size = size
@@ -1,73 +1,39 @@
-import collections
-import threading
-
 import imgviz
 import numpy as np
-import onnxruntime
-import skimage
 
-from ..logger import logger
-from . import _utils
+from .base_model import BaseModel
 
 
-class SegmentAnythingModel:
-    def __init__(self, encoder_path, decoder_path):
+class SegmentAnythingModel(BaseModel):
+    def __init__(self, *args, **kwargs):
+        super(SegmentAnythingModel, self).__init__(*args, **kwargs)
         self._image_size = 1024
+        # reused for every image, as it is 12MB in float32
+        self._input_buffer = np.empty(
+            (1, 3, self._image_size, self._image_size), dtype=np.float32
+        )
 
-        self._encoder_session = onnxruntime.InferenceSession(encoder_path)
-        self._decoder_session = onnxruntime.InferenceSession(decoder_path)
-
-        self._lock = threading.Lock()
-        self._image_embedding_cache = collections.OrderedDict()
-
-        self._thread = None
-
-    def set_image(self, image: np.ndarray):
-        with self._lock:
-            self._image = image
-            self._image_embedding = self._image_embedding_cache.get(
-                self._image.tobytes()
-            )
-
-        if self._image_embedding is None:
-            self._thread = threading.Thread(
-                target=self._compute_and_cache_image_embedding
-            )
-            self._thread.start()
-
-    def _compute_and_cache_image_embedding(self):
-        with self._lock:
-            logger.debug("Computing image embedding...")
-            self._image_embedding = _compute_image_embedding(
-                image_size=self._image_size,
-                encoder_session=self._encoder_session,
-                image=self._image,
-            )
-            if len(self._image_embedding_cache) > 10:
-                self._image_embedding_cache.popitem(last=False)
-            self._image_embedding_cache[self._image.tobytes()] = self._image_embedding
-            logger.debug("Done computing image embedding.")
-
-    def _get_image_embedding(self):
-        if self._thread is not None:
-            self._thread.join()
-            self._thread = None
-        with self._lock:
-            return self._image_embedding
-
-    def predict_mask_from_points(self, points, point_labels):
-        return _compute_mask_from_points(
+    def _encode_image(self, image):
+        return _compute_image_embedding(
             image_size=self._image_size,
-            decoder_session=self._decoder_session,
-            image=self._image,
-            image_embedding=self._get_image_embedding(),
-            points=points,
-            point_labels=point_labels,
+            encoder_session=self._encoder_session,
+            image=image,
+            input_buffer=self._input_buffer,
         )
 
-    def predict_polygon_from_points(self, points, point_labels):
-        mask = self.predict_mask_from_points(points=points, point_labels=point_labels)
-        return _utils.compute_polygon_from_mask(mask=mask)
+    def _decode_masks(self, image, image_embedding, prompts):
+        # the exported decoder takes a single prompt
+        return [
+            _compute_mask_from_points(
+                image_size=self._image_size,
+                decoder_session=self._decoder_session,
+                image=image,
+                image_embedding=image_embedding,
+                points=points,
+                point_labels=point_labels,
+            )
+            for points, point_labels in prompts
+        ]
 
 
 def _compute_scale_to_resize_image(image_size, image):
@@ -92,28 +58,31 @@ def _resize_image(image_size, image):
         height=new_height,
         width=new_width,
         backend="pillow",
-    ).astype(np.float32)
+    )
     return scale, scaled_image
 
 
-def _compute_image_embedding(image_size, encoder_session, image):
-    image = imgviz.asrgb(image)
+_PIXEL_MEAN = np.array([123.675, 116.28, 103.53], dtype=np.float32)
+_PIXEL_STD = np.array([58.395, 57.12, 57.375], dtype=np.float32)
 
-    scale, x = _resize_image(image_size, image)
-    x = (x - np.array([123.675, 116.28, 103.53], dtype=np.float32)) / np.array(
-        [58.395, 57.12, 57.375], dtype=np.float32
-    )
-    x = np.pad(
-        x,
-        (
-            (0, image_size - x.shape[0]),
-            (0, image_size - x.shape[1]),
-            (0, 0),
-        ),
-    )
-    x = x.transpose(2, 0, 1)[None, :, :, :]
 
-    output = encoder_session.run(output_names=None, input_feed={"x": x})
+def _compute_image_embedding(image_size, encoder_session, image, input_buffer=None):
+    if input_buffer is None:
+        input_buffer = np.empty((1, 3, image_size, image_size), dtype=np.float32)
+
+    image = imgviz.asrgb(image)
+
+    # the resized image is normalized and padded in the input buffer, without
+    # full-size temporaries
+    _, x = _resize_image(image_size, image)
+    height, width = x.shape[:2]
+    y = input_buffer[0, :, :height, :width]
+    np.subtract(x.transpose(2, 0, 1), _PIXEL_MEAN[:, None, None], out=y)
+    y /= _PIXEL_STD[:, None, None]
+    input_buffer[0, :, height:, :] = 0
+    input_buffer[0, :, :height, width:] = 0
+
+    output = encoder_session.run(output_names=None, input_feed={"x": input_buffer})
     image_embedding = output[0]
 
     return image_embedding
@@ -122,6 +91,8 @@ def _compute_image_embedding(image_size, encoder_session, image):
 def _compute_mask_from_points(
     image_size, decoder_session, image, image_embedding, points, point_labels
 ):
+    import skimage.morphology
+
     input_point = np.array(points, dtype=np.float32)
     input_label = np.array(point_labels, dtype=np.int32)
 
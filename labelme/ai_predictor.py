@@ -0,0 +1,51 @@
+import threading
+
+from qtpy import QtCore
+
+from labelme.logger import logger
+
+
+class AiPredictor(QtCore.QObject):
+    """Run predictions of AI models in a background thread.
+
+    Requests are coalesced: a request replaces the pending one, so only the
+    latest request is computed after the running one, and the result is
+    emitted with the key of the request by `predicted`.
+    """
+
+    predicted = QtCore.Signal(object, object)  # key, result
+
+    def __init__(self, parent=None):
+        super(AiPredictor, self).__init__(parent)
+        self._condition = threading.Condition()
+        self._request = None
+        self._thread = None
+
+    def request(self, key, function, *args, **kwargs):
+        with self._condition:
+            self._request = (key, function, args, kwargs)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self):
+        with self._condition:
+            self._request = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None:
+                    self._condition.wait()
+                key, function, args, kwargs = self._request
+                self._request = None
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                logger.error("Failed to run AI prediction: {}".format(e))
+                continue
+            try:
+                self.predicted.emit(key, result)
+            except RuntimeError:  # deleted with the parent
+                return
@@ -9,7 +9,6 @@ import re
 import webbrowser
 
 import imgviz
-import natsort
 from qtpy import QtCore
 from qtpy import QtGui
 from qtpy import QtWidgets
@@ -17,8 +16,12 @@ from qtpy.QtCore import Qt
 
 from labelme import PY2
 from labelme import __appname__
-from labelme.ai import MODELS
+from labelme.ai import create_embedding_cache
+from labelme.ai import get_models
 from labelme.config import get_config
+from labelme.image_prefetcher import ImagePrefetcher
+from labelme.image_scanner import ImageScanner
+from labelme.image_scanner import iter_images
 from labelme.label_file import LabelFile
 from labelme.label_file import LabelFileError
 from labelme.logger import logger
@@ -26,6 +29,7 @@ from labelme.shape import Shape
 from labelme.widgets import BrightnessContrastDialog
 from labelme.widgets import Canvas
 from labelme.widgets import FileDialogPreview
+from labelme.widgets import FileListWidget
 from labelme.widgets import LabelDialog
 from labelme.widgets import LabelListWidget
 from labelme.widgets import LabelListWidgetItem
@@ -48,6 +52,9 @@ GROUP_ID_COLORMAP = utils.shape.generate_random_colors(100, bright=True)
 class MainWindow(QtWidgets.QMainWindow):
     FIT_WINDOW, FIT_WIDTH, MANUAL_ZOOM = 0, 1, 2
 
+    # emitted from the threads of the image prefetcher
+    _aiImagePrefetched = QtCore.Signal(QtGui.QImage)
+
     def __init__(
         self,
         config=None,
@@ -145,7 +152,7 @@ class MainWindow(QtWidgets.QMainWindow):
         self.fileSearch = QtWidgets.QLineEdit()
         self.fileSearch.setPlaceholderText(self.tr("Search Filename"))
         self.fileSearch.textChanged.connect(self.fileSearchChanged)
-        self.fileListWidget = QtWidgets.QListWidget()
+        self.fileListWidget = FileListWidget(is_checked=self._hasLabelFile)
         self.fileListWidget.itemSelectionChanged.connect(self.fileSelectionChanged)
         fileListLayout = QtWidgets.QVBoxLayout()
         fileListLayout.setContentsMargins(0, 0, 0, 0)
@@ -161,11 +168,18 @@ class MainWindow(QtWidgets.QMainWindow):
         self.zoomWidget = ZoomWidget()
         self.setAcceptDrops(True)
 
+        ai_models = get_models(self._config["ai"]["models"])
         self.canvas = self.labelList.canvas = Canvas(
             epsilon=self._config["epsilon"],
             double_click=self._config["canvas"]["double_click"],
             num_backups=self._config["canvas"]["num_backups"],
             crosshair=self._config["canvas"]["crosshair"],
+            ai_embedding_cache=create_embedding_cache(
+                self._config["ai"]["embedding_cache"]
+            ),
+            ai_session_config=self._config["ai"]["session"],
+            ai_max_image_size=self._config["ai"]["max_image_size"],
+            ai_models=ai_models,
         )
         self.canvas.zoomRequest.connect(self.zoomRequest)
 
@@ -799,7 +813,7 @@ class MainWindow(QtWidgets.QMainWindow):
         #
         self._selectAiModelComboBox = QtWidgets.QComboBox()
         selectAiModel.defaultWidget().layout().addWidget(self._selectAiModelComboBox)
-        model_names = [model.name for model in MODELS]
+        model_names = [model.name for model in ai_models]
         self._selectAiModelComboBox.addItems(model_names)
         if self._config["ai"]["default"] in model_names:
             model_index = model_names.index(self._config["ai"]["default"])
@@ -855,6 +869,13 @@ class MainWindow(QtWidgets.QMainWindow):
 
         # Application state.
         self.image = QtGui.QImage()
+        self._imagePrefetcher = ImagePrefetcher(
+            num_workers=self._config["prefetch"]["num_workers"],
+            max_memory=self._config["prefetch"]["max_memory"] * 2**20,
+        )
+        self._aiImagePrefetched.connect(
+            self._prefetchAiImage, QtCore.Qt.QueuedConnection
+        )
         self.imagePath = None
         self.recentFiles = []
         self.maxRecent = 7
@@ -868,14 +889,21 @@ class MainWindow(QtWidgets.QMainWindow):
             Qt.Vertical: {},
         }  # key=filename, value=scroll_value
 
-        if filename is not None and osp.isdir(filename):
-            self.importDirImages(filename, load=False)
-        else:
-            self.filename = filename
+        self._imageScanner = None
+        self._imageScanCancelButton = QtWidgets.QPushButton(self.tr("Cancel Scan"))
+        self._imageScanCancelButton.setToolTip(self.tr("Cancel scanning images"))
+        self._imageScanCancelButton.clicked.connect(self.cancelImportDirImages)
+        self._imageScanCancelButton.hide()
+        self.statusBar().addPermanentWidget(self._imageScanCancelButton)
 
         if config["file_search"]:
             self.fileSearch.setText(config["file_search"])
-            self.fileSearchChanged()
+
+        if filename is not None and osp.isdir(filename):
+            # the first image is loaded once it is found by the scan
+            self.importDirImages(filename, pattern=config["file_search"])
+        else:
+            self.filename = filename
 
         # XXX: Could be completely declarative.
         # Restore application settings.
@@ -1158,19 +1186,14 @@ class MainWindow(QtWidgets.QMainWindow):
         )
 
     def fileSelectionChanged(self):
-        items = self.fileListWidget.selectedItems()
-        if not items:
+        filenames = self.fileListWidget.selectedFilenames()
+        if not filenames:
             return
-        item = items[0]
 
         if not self.mayContinue():
             return
 
-        currIndex = self.imageList.index(str(item.text()))
-        if currIndex < len(self.imageList):
-            filename = self.imageList[currIndex]
-            if filename:
-                self.loadFile(filename)
+        self.loadFile(filenames[0])
 
     # React to canvas signals.
     def shapeSelectionChanged(self, selected_shapes):
@@ -1332,7 +1355,7 @@ class MainWindow(QtWidgets.QMainWindow):
                     description=s.description,
                     shape_type=s.shape_type,
                     flags=s.flags,
-                    mask=None if s.mask is None else utils.img_arr_to_b64(s.mask),
+                    mask=s.mask,
                 )
             )
             return data
@@ -1358,13 +1381,11 @@ class MainWindow(QtWidgets.QMainWindow):
                 imageWidth=self.image.width(),
                 otherData=self.otherData,
                 flags=flags,
+                sidecar=self._config["store_data_in_sidecar"],
             )
             self.labelFile = lf
-            items = self.fileListWidget.findItems(self.imagePath, Qt.MatchExactly)
-            if len(items) > 0:
-                if len(items) != 1:
-                    raise RuntimeError("There are duplicate files.")
-                items[0].setCheckState(Qt.Checked)
+            # the entry in the list, which imagePath may differ from
+            self.fileListWidget.setChecked(self.filename, True)
             # disable allows next and previous image to proceed
             # self.filename = filename
             return True
@@ -1546,10 +1567,9 @@ class MainWindow(QtWidgets.QMainWindow):
     def loadFile(self, filename=None):
         """Load the specified file, or the last opened file if None."""
         # changing fileListWidget loads file
-        if filename in self.imageList and (
-            self.fileListWidget.currentRow() != self.imageList.index(filename)
-        ):
-            self.fileListWidget.setCurrentRow(self.imageList.index(filename))
+        row = self.fileListWidget.indexOf(filename)
+        if row >= 0 and self.fileListWidget.currentRow() != row:
+            self.fileListWidget.setCurrentRow(row)
             self.fileListWidget.repaint()
             return
 
@@ -1566,36 +1586,26 @@ class MainWindow(QtWidgets.QMainWindow):
             return False
         # assumes same name, but json extension
         self.status(str(self.tr("Loading %s...")) % osp.basename(str(filename)))
-        label_file = osp.splitext(filename)[0] + ".json"
-        if self.output_dir:
-            label_file_without_path = osp.basename(label_file)
-            label_file = osp.join(self.output_dir, label_file_without_path)
-        if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(label_file):
-            try:
-                self.labelFile = LabelFile(label_file)
-            except LabelFileError as e:
-                self.errorMessage(
-                    self.tr("Error opening file"),
-                    self.tr(
-                        "<p><b>%s</b></p>"
-                        "<p>Make sure <i>%s</i> is a valid label file."
-                    )
-                    % (e, label_file),
+        label_file = self._getExistingLabelFile(filename)
+        try:
+            loaded = self._imagePrefetcher.get(filename, label_file)
+        except LabelFileError as e:
+            self.errorMessage(
+                self.tr("Error opening file"),
+                self.tr(
+                    "<p><b>%s</b></p>" "<p>Make sure <i>%s</i> is a valid label file."
                 )
-                self.status(self.tr("Error reading %s") % label_file)
-                return False
-            self.imageData = self.labelFile.imageData
-            self.imagePath = osp.join(
-                osp.dirname(label_file),
-                self.labelFile.imagePath,
+                % (e, label_file),
             )
+            self.status(self.tr("Error reading %s") % label_file)
+            return False
+        self.labelFile = loaded.labelFile
+        self.imageData = loaded.imageData
+        if loaded.imagePath:
+            self.imagePath = loaded.imagePath
+        if self.labelFile:
             self.otherData = self.labelFile.otherData
-        else:
-            self.imageData = LabelFile.load_image_file(filename)
-            if self.imageData:
-                self.imagePath = filename
-            self.labelFile = None
-        image = QtGui.QImage.fromData(self.imageData)
+        image = loaded.image
 
         if image.isNull():
             formats = [
@@ -1642,11 +1652,6 @@ class MainWindow(QtWidgets.QMainWindow):
                     orientation, self.scroll_values[orientation][self.filename]
                 )
         # set brightness contrast values
-        dialog = BrightnessContrastDialog(
-            utils.img_data_to_pil(self.imageData),
-            self.onNewBrightnessContrast,
-            parent=self,
-        )
         brightness, contrast = self.brightnessContrast_values.get(
             self.filename, (None, None)
         )
@@ -1658,20 +1663,69 @@ class MainWindow(QtWidgets.QMainWindow):
             _, contrast = self.brightnessContrast_values.get(
                 self.recentFiles[0], (None, None)
             )
-        if brightness is not None:
-            dialog.slider_brightness.setValue(brightness)
-        if contrast is not None:
-            dialog.slider_contrast.setValue(contrast)
         self.brightnessContrast_values[self.filename] = (brightness, contrast)
         if brightness is not None or contrast is not None:
+            dialog = BrightnessContrastDialog(
+                utils.img_data_to_pil(self.imageData),
+                self.onNewBrightnessContrast,
+                parent=self,
+            )
+            if brightness is not None:
+                dialog.slider_brightness.setValue(brightness)
+            if contrast is not None:
+                dialog.slider_contrast.setValue(contrast)
             dialog.onNewValue(None)
         self.paintCanvas()
         self.addRecentFile(self.filename)
         self.toggleActions(True)
         self.canvas.setFocus()
         self.status(str(self.tr("Loaded %s")) % osp.basename(str(filename)))
+        self.prefetchNeighborImages()
         return True
 
+    def _getExistingLabelFile(self, filename):
+        label_file = osp.splitext(filename)[0] + ".json"
+        if self.output_dir:
+            label_file_without_path = osp.basename(label_file)
+            label_file = osp.join(self.output_dir, label_file_without_path)
+        if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(label_file):
+            return label_file
+        return None
+
+    def _hasLabelFile(self, filename):
+        return self._getExistingLabelFile(filename) is not None
+
+    def prefetchNeighborImages(self):
+        """Load the next and previous images in background."""
+        row = self.fileListWidget.currentRow()
+        if row < 0:
+            return
+        items = []
+        for offset in range(1, self._config["prefetch"]["num_images"] + 1):
+            for i in [row + offset, row - offset]:
+                if 0 <= i < self.fileListWidget.count():
+                    filename = self.fileListWidget.filename(i)
+                    items.append((filename, self._getExistingLabelFile(filename)))
+        callback = None
+        if self._isAiModeActive():
+            # the image embeddings are also computed in advance
+
+            def callback(loaded):
+                self._aiImagePrefetched.emit(loaded.image)
+
+        self._imagePrefetcher.prefetch(items, callback=callback)
+
+    def _isAiModeActive(self):
+        return not self.canvas.editing() and self.canvas.createMode in [
+            "ai_polygon",
+            "ai_mask",
+        ]
+
+    def _prefetchAiImage(self, image):
+        # the mode may be changed while the image is loaded
+        if self._isAiModeActive():
+            self.canvas.prefetchAiImage(image)
+
     def resizeEvent(self, event):
         if (
             self.canvas
@@ -1717,6 +1771,12 @@ class MainWindow(QtWidgets.QMainWindow):
     def closeEvent(self, event):
         if not self.mayContinue():
             event.ignore()
+        else:
+            self.cancelImportDirImages()
+            for scanner in self.findChildren(ImageScanner):
+                scanner.wait()  # interrupted, so it stops shortly
+            # drop the queued loads, which are no longer needed
+            self._imagePrefetcher.shutdown()
         self.settings.setValue("filename", self.filename if self.filename else "")
         self.settings.setValue("window/size", self.size())
         self.settings.setValue("window/position", self.pos())
@@ -1760,15 +1820,15 @@ class MainWindow(QtWidgets.QMainWindow):
         if not self.mayContinue():
             return
 
-        if len(self.imageList) <= 0:
+        if len(self.fileListWidget) <= 0:
             return
 
         if self.filename is None:
             return
 
-        currIndex = self.imageList.index(self.filename)
+        currIndex = self.fileListWidget.indexOf(self.filename)
         if currIndex - 1 >= 0:
-            filename = self.imageList[currIndex - 1]
+            filename = self.fileListWidget.filename(currIndex - 1)
             if filename:
                 self.loadFile(filename)
 
@@ -1784,18 +1844,18 @@ class MainWindow(QtWidgets.QMainWindow):
         if not self.mayContinue():
             return
 
-        if len(self.imageList) <= 0:
+        if len(self.fileListWidget) <= 0:
             return
 
         filename = None
         if self.filename is None:
-            filename = self.imageList[0]
+            filename = self.fileListWidget.filename(0)
         else:
-            currIndex = self.imageList.index(self.filename)
-            if currIndex + 1 < len(self.imageList):
-                filename = self.imageList[currIndex + 1]
+            currIndex = self.fileListWidget.indexOf(self.filename)
+            if currIndex + 1 < len(self.fileListWidget):
+                filename = self.fileListWidget.filename(currIndex + 1)
             else:
-                filename = self.imageList[-1]
+                filename = self.fileListWidget.filename(-1)
         self.filename = filename
 
         if self.filename and load:
@@ -1854,13 +1914,8 @@ class MainWindow(QtWidgets.QMainWindow):
         )
         self.statusBar().show()
 
-        current_filename = self.filename
-        self.importDirImages(self.lastOpenDir, load=False)
-
-        if current_filename in self.imageList:
-            # retain currently selected file
-            self.fileListWidget.setCurrentRow(self.imageList.index(current_filename))
-            self.fileListWidget.repaint()
+        # retain currently selected file
+        self.importDirImages(self.lastOpenDir, load=False, select=self.filename)
 
     def saveFile(self, _value=False):
         assert not self.image.isNull(), "cannot save empty image"
@@ -1943,8 +1998,8 @@ class MainWindow(QtWidgets.QMainWindow):
             os.remove(label_file)
             logger.info("Label file is removed: {}".format(label_file))
 
-            item = self.fileListWidget.currentItem()
-            item.setCheckState(Qt.Unchecked)
+            # the entry in the list, which imagePath may differ from
+            self.fileListWidget.setChecked(self.filename, False)
 
             self.resetState()
 
@@ -2055,11 +2110,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     @property
     def imageList(self):
-        lst = []
-        for i in range(self.fileListWidget.count()):
-            item = self.fileListWidget.item(i)
-            lst.append(item.text())
-        return lst
+        return self.fileListWidget.filenames()
 
     def importDroppedImageFiles(self, imageFiles):
         extensions = [
@@ -2068,72 +2119,111 @@ class MainWindow(QtWidgets.QMainWindow):
         ]
 
         self.filename = None
-        for file in imageFiles:
-            if file in self.imageList or not file.lower().endswith(tuple(extensions)):
-                continue
-            label_file = osp.splitext(file)[0] + ".json"
-            if self.output_dir:
-                label_file_without_path = osp.basename(label_file)
-                label_file = osp.join(self.output_dir, label_file_without_path)
-            item = QtWidgets.QListWidgetItem(file)
-            item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
-            if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(label_file):
-                item.setCheckState(Qt.Checked)
-            else:
-                item.setCheckState(Qt.Unchecked)
-            self.fileListWidget.addItem(item)
+        # checked state is computed when the file is shown in the list
+        self.fileListWidget.addFiles(
+            [file for file in imageFiles if file.lower().endswith(tuple(extensions))]
+        )
 
-        if len(self.imageList) > 1:
+        if len(self.fileListWidget) > 1:
             self.actions.openNextImg.setEnabled(True)
             self.actions.openPrevImg.setEnabled(True)
 
         self.openNextImg()
 
-    def importDirImages(self, dirpath, pattern=None, load=True):
+    def importDirImages(self, dirpath, pattern=None, load=True, select=None):
+        """Scan images under dirpath in background and add them to the list.
+
+        The first image is opened once it is found (and loaded if load=True),
+        and then `select` is selected if it is found.
+        """
         self.actions.openNextImg.setEnabled(True)
         self.actions.openPrevImg.setEnabled(True)
 
         if not self.mayContinue() or not dirpath:
             return
 
+        self.cancelImportDirImages()
         self.lastOpenDir = dirpath
         self.filename = None
         self.fileListWidget.clear()
 
-        filenames = self.scanAllImages(dirpath)
         if pattern:
             try:
-                filenames = [f for f in filenames if re.search(pattern, f)]
+                re.compile(pattern)
             except re.error:
-                pass
-        for filename in filenames:
-            label_file = osp.splitext(filename)[0] + ".json"
-            if self.output_dir:
-                label_file_without_path = osp.basename(label_file)
-                label_file = osp.join(self.output_dir, label_file_without_path)
-            item = QtWidgets.QListWidgetItem(filename)
-            item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsSelectable)
-            if QtCore.QFile.exists(label_file) and LabelFile.is_label_file(label_file):
-                item.setCheckState(Qt.Checked)
-            else:
-                item.setCheckState(Qt.Unchecked)
-            self.fileListWidget.addItem(item)
-        self.openNextImg(load=load)
+                pattern = None
+        scanner = ImageScanner(
+            dirpath,
+            extensions=self._getImageExtensions(),
+            output_dir=self.output_dir,
+            pattern=pattern or None,
+            parent=self,
+        )
+        scanner.imagesFound.connect(
+            lambda images: self._onImagesFound(scanner, images, load, select)
+        )
+        scanner.finished.connect(lambda: self._onImageScanFinished(scanner))
+        self._imageScanner = scanner
+        self._imageScanCancelButton.show()
+        scanner.start()
 
-    def scanAllImages(self, folderPath):
-        extensions = [
+    def cancelImportDirImages(self):
+        scanner = self._imageScanner
+        if scanner is None:
+            return
+        self._imageScanner = None
+        self._imageScanCancelButton.hide()
+        # not to block the UI (e.g., on every key in the search box), the
+        # scanner is left to stop in background and deleted after that
+        scanner.imagesFound.disconnect()
+        scanner.finished.disconnect()
+        scanner.finished.connect(scanner.deleteLater)
+        scanner.requestInterruption()
+        if scanner.isFinished():
+            scanner.deleteLater()
+        self.status(
+            self.tr("Cancelled scanning images, %d found") % self.fileListWidget.count()
+        )
+
+    def _onImagesFound(self, scanner, images, load, select):
+        if scanner is not self._imageScanner:
+            return  # cancelled
+        is_first_batch = self.fileListWidget.count() == 0
+        filenames, checked = zip(*images)
+        self.fileListWidget.addFiles(list(filenames), checked=list(checked))
+        row_to_select = None
+        if select is not None and select in filenames:
+            row_to_select = self.fileListWidget.indexOf(select)
+        self.status(
+            self.tr("Scanning images, %d found...") % self.fileListWidget.count()
+        )
+        if is_first_batch:
+            self.openNextImg(load=load)
+        if row_to_select is not None:
+            self.fileListWidget.setCurrentRow(row_to_select)
+            self.fileListWidget.repaint()
+
+    def _onImageScanFinished(self, scanner):
+        if scanner is not self._imageScanner:
+            return  # cancelled
+        self._imageScanner = None
+        self._imageScanCancelButton.hide()
+        scanner.deleteLater()
+        self.status(self.tr("Found %d images") % self.fileListWidget.count())
+
+    def _getImageExtensions(self):
+        return [
             ".%s" % fmt.data().decode().lower()
             for fmt in QtGui.QImageReader.supportedImageFormats()
         ]
 
-        images = []
-        for root, dirs, files in os.walk(folderPath):
-            for file in files:
-                if file.lower().endswith(tuple(extensions)):
-                    relativePath = os.path.normpath(osp.join(root, file))
-                    images.append(relativePath)
-        images = natsort.os_sorted(images)
-        return images
+    def scanAllImages(self, folderPath):
+        return [
+            filename
+            for filename, _ in iter_images(
+                folderPath, extensions=self._getImageExtensions()
+            )
+        ]
 
     def setGroupIdSort(self):
         if not self.canvas.groupIdColorObjSort:
@@ -1,6 +1,8 @@
 # flake8: noqa
 
+from . import auto_annotate
 from . import draw_json
 from . import draw_label_png
 from . import export_json
 from . import on_docker
+from . import precompute_embeddings
@@ -0,0 +1,365 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import os.path as osp
+import time
+
+import numpy as np
+from qtpy import QtGui
+
+import labelme.ai
+from labelme import utils
+from labelme.ai import _utils
+from labelme.config import get_config
+from labelme.label_file import LabelFile
+from labelme.logger import logger
+
+STAGES = ["load", "embed", "decode", "postprocess", "save"]
+
+_model = None
+
+
+def _get_model(model_name, ai_config):
+    # a model per process, which is reused for the label files of the process
+    global _model
+    if _model is None:
+        model = [
+            model
+            for model in labelme.ai.get_models(ai_config["models"])
+            if model.name == model_name
+        ][0]
+        _model = model(
+            embedding_cache=labelme.ai.create_embedding_cache(
+                ai_config["embedding_cache"]
+            ),
+            session_config=ai_config["session"],
+            max_image_size=ai_config["max_image_size"],
+        )
+    return _model
+
+
+def _iter_label_files(dirpath, exclude_dir=None):
+    for root, dirnames, filenames in os.walk(dirpath):
+        dirnames[:] = sorted(
+            dirname
+            for dirname in dirnames
+            if exclude_dir is None
+            or osp.abspath(osp.join(root, dirname)) != osp.abspath(exclude_dir)
+        )
+        for filename in sorted(filenames):
+            if LabelFile.is_label_file(filename):
+                yield osp.normpath(osp.join(root, filename))
+
+
+def _box_prompt(points):
+    (x1, y1), (x2, y2) = np.asarray(points, dtype=float)
+    # top-left and bottom-right corners labeled 2 and 3
+    return [
+        [min(x1, x2), min(y1, y2)],
+        [max(x1, x2), max(y1, y2)],
+    ], [2, 3]
+
+
+def _mask_to_shape(mask, shape_type):
+    """Return points and mask of a polygon or mask shape, or None if empty."""
+    if shape_type == "polygon":
+        points = _utils.compute_polygon_from_mask(mask=mask)
+        if len(points) < 3:
+            return None
+        return [[float(x), float(y)] for x, y in points], None
+    ys, xs = np.nonzero(mask)
+    if len(ys) == 0:
+        return None
+    x1, y1, x2, y2 = xs.min(), ys.min(), xs.max(), ys.max()
+    return [[float(x1), float(y1)], [float(x2), float(y2)]], mask[
+        y1 : y2 + 1, x1 : x2 + 1
+    ]
+
+
+def _format_shape(shape, **kwargs):
+    data = shape["other_data"].copy()
+    data.update(
+        label=shape["label"],
+        points=shape["points"],
+        group_id=shape["group_id"],
+        description=shape["description"],
+        shape_type=shape["shape_type"],
+        flags=shape["flags"],
+        mask=shape["mask"],
+    )
+    data.update(kwargs)
+    return data
+
+
+def annotate(
+    model,
+    label_file,
+    output_file=None,
+    shape_type="polygon",
+    keep_rectangles=False,
+    store_data=True,
+    sidecar=False,
+):
+    """Replace rectangles in a label file with shapes predicted by the model.
+
+    Each rectangle is given to the model as a box prompt, and all the boxes
+    of the image are decoded at once with the image embedding computed once.
+    It returns (num_rectangles, num_shapes, seconds of each stage).
+    """
+    assert shape_type in ["polygon", "mask"]
+    if output_file is None:
+        output_file = label_file
+    times = collections.OrderedDict((stage, 0.0) for stage in STAGES)
+
+    t_start = time.time()
+    # the image is loaded only if there are rectangles to annotate
+    labelFile = LabelFile(label_file, load_image=False)
+    rectangles = [
+        shape for shape in labelFile.shapes if shape["shape_type"] == "rectangle"
+    ]
+    image = None
+    if rectangles:
+        image = QtGui.QImage.fromData(labelFile.imageData)
+    times["load"] = time.time() - t_start
+    if not rectangles and output_file == label_file:
+        return 0, 0, times
+
+    masks = []
+    if rectangles:
+        t_start = time.time()
+        # same as the image given to the model in the app
+        model.set_image(
+            utils.img_qt_to_arr(image, max_size=model.max_image_size),
+            original_shape=(image.height(), image.width()),
+        )
+        if model.wait_image_embedding() is None:
+            raise RuntimeError("image embedding is not computed")
+        times["embed"] = time.time() - t_start
+
+        t_start = time.time()
+        masks = model.predict_masks_from_prompts(
+            [_box_prompt(shape["points"]) for shape in rectangles]
+        )
+        times["decode"] = time.time() - t_start
+
+    t_start = time.time()
+    predicted = {}
+    for shape, mask in zip(rectangles, masks):
+        points_and_mask = _mask_to_shape(mask, shape_type=shape_type)
+        if points_and_mask is None:
+            logger.warning(
+                "No {} is predicted for {!r} in {!r}".format(
+                    shape_type, shape["label"], label_file
+                )
+            )
+            continue
+        predicted[id(shape)] = _format_shape(
+            shape,
+            points=points_and_mask[0],
+            shape_type=shape_type,
+            mask=points_and_mask[1],
+        )
+    shapes = []
+    for shape in labelFile.shapes:
+        if id(shape) not in predicted or keep_rectangles:
+            shapes.append(_format_shape(shape))
+        if id(shape) in predicted:
+            shapes.append(predicted[id(shape)])
+    times["postprocess"] = time.time() - t_start
+
+    t_start = time.time()
+    imagePath = osp.join(osp.dirname(label_file), labelFile.imagePath)
+    if osp.dirname(output_file) and not osp.exists(osp.dirname(output_file)):
+        os.makedirs(osp.dirname(output_file))
+    LabelFile().save(
+        filename=output_file,
+        shapes=shapes,
+        imagePath=osp.relpath(imagePath, osp.dirname(output_file) or "."),
+        imageData=labelFile.imageData if store_data else None,
+        imageHeight=labelFile.imageHeight,
+        imageWidth=labelFile.imageWidth,
+        otherData=labelFile.otherData,
+        flags=labelFile.flags,
+        sidecar=sidecar,
+    )
+    times["save"] = time.time() - t_start
+    return len(rectangles), len(predicted), times
+
+
+def _annotate_file(model_name, ai_config, label_file, **kwargs):
+    try:
+        model = _get_model(model_name, ai_config)
+        return label_file, annotate(model, label_file, **kwargs), None
+    except Exception as e:
+        return label_file, None, "{}: {}".format(type(e).__name__, e)
+
+
+def _read_progress(progress_file):
+    if not osp.exists(progress_file):
+        return set()
+    with open(progress_file) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def _log_times(num_done, times):
+    logger.info(
+        "Processed {} label files ({})".format(
+            num_done,
+            ", ".join(
+                "{}: {:.3f} s/file".format(stage, times[stage] / max(1, num_done))
+                for stage in STAGES
+            ),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Annotate polygons or masks from the rectangles in label "
+        "files with an AI model, using each rectangle as a box prompt.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("dirpath", help="directory of label files")
+    default_config_file = osp.join(osp.expanduser("~"), ".labelmerc")
+    parser.add_argument(
+        "--config",
+        default=default_config_file,
+        help="config file or yaml-format string",
+    )
+    parser.add_argument("--model", help="AI model (default: ai.default in config)")
+    parser.add_argument(
+        "--shape-type",
+        choices=["polygon", "mask"],
+        default="polygon",
+        help="type of the annotated shapes",
+    )
+    parser.add_argument(
+        "--keep-rectangles",
+        action="store_true",
+        help="keep the rectangles in addition to the annotated shapes",
+    )
+    parser.add_argument(
+        "--output",
+        "-O",
+        "-o",
+        help="directory to save label files to (default: overwrite them)",
+    )
+    parser.add_argument(
+        "--nodata",
+        action="store_true",
+        help="stop storing image data to JSON file",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes, each of which loads the model",
+    )
+    parser.add_argument(
+        "--progress",
+        help="file recording the processed label files, which are skipped "
+        "when resumed (default: .labelme_auto_annotate in output or dirpath)",
+    )
+    args = parser.parse_args()
+
+    config = get_config(args.config)
+    model_name = args.model or config["ai"]["default"]
+    model_names = [
+        model.name for model in labelme.ai.get_models(config["ai"]["models"])
+    ]
+    if model_name not in model_names:
+        parser.error(
+            "unsupported model {!r}, choose from {}".format(model_name, model_names)
+        )
+
+    progress_file = args.progress or osp.join(
+        args.output or args.dirpath, ".labelme_auto_annotate"
+    )
+    done = _read_progress(progress_file)
+    if done:
+        logger.info(
+            "Resuming, skipping {} label files in {!r}".format(len(done), progress_file)
+        )
+    if osp.dirname(progress_file) and not osp.exists(osp.dirname(progress_file)):
+        os.makedirs(osp.dirname(progress_file))
+
+    kwargs = dict(
+        shape_type=args.shape_type,
+        keep_rectangles=args.keep_rectangles,
+        store_data=config["store_data"] and not args.nodata,
+        sidecar=config["store_data_in_sidecar"],
+    )
+    label_files = (
+        label_file
+        for label_file in _iter_label_files(args.dirpath, exclude_dir=args.output)
+        if label_file not in done
+    )
+
+    t_start = time.time()
+    times = collections.OrderedDict((stage, 0.0) for stage in STAGES)
+    num_done = num_failed = num_shapes = 0
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max(1, args.workers)
+    ) as executor, open(progress_file, "a") as progress:
+
+        def handle(future):
+            nonlocal num_done, num_failed, num_shapes
+            label_file, result, error = future.result()
+            if error is not None:
+                logger.error("Failed to annotate {!r}: {}".format(label_file, error))
+                num_failed += 1
+                return
+            _, num_file_shapes, file_times = result
+            for stage in STAGES:
+                times[stage] += file_times[stage]
+            num_shapes += num_file_shapes
+            num_done += 1
+            progress.write(label_file + "\n")
+            progress.flush()
+            if num_done % 100 == 0:
+                _log_times(num_done, times)
+
+        # label files are submitted as the workers proceed, so that the
+        # listing is streamed and the pending tasks are bounded
+        pending = set()
+        for label_file in label_files:
+            if len(pending) >= 4 * max(1, args.workers):
+                finished, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in finished:
+                    handle(future)
+            output_file = None
+            if args.output:
+                output_file = osp.join(
+                    args.output, osp.relpath(label_file, args.dirpath)
+                )
+            pending.add(
+                executor.submit(
+                    _annotate_file,
+                    model_name,
+                    config["ai"],
+                    label_file,
+                    output_file=output_file,
+                    **kwargs,
+                )
+            )
+        for future in concurrent.futures.as_completed(pending):
+            handle(future)
+
+    _log_times(num_done, times)
+    logger.info(
+        "Annotated {} shapes in {} label files in {:.1f} s".format(
+            num_shapes, num_done, time.time() - t_start
+        )
+    )
+    if num_failed:
+        logger.warning(
+            "Failed to annotate {} label files, which are retried when "
+            "resumed".format(num_failed)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,4 @@
 import argparse
-import base64
-import json
 import os
 import os.path as osp
 
@@ -8,6 +6,7 @@ import imgviz
 import PIL.Image
 
 from labelme import utils
+from labelme.label_file import LabelFile
 from labelme.logger import logger
 
 
@@ -37,25 +36,19 @@ def main():
     if not osp.exists(out_dir):
         os.mkdir(out_dir)
 
-    data = json.load(open(json_file))
-    imageData = data.get("imageData")
-
-    if not imageData:
-        imagePath = os.path.join(os.path.dirname(json_file), data["imagePath"])
-        with open(imagePath, "rb") as f:
-            imageData = f.read()
-            imageData = base64.b64encode(imageData).decode("utf-8")
-    img = utils.img_b64_to_arr(imageData)
+    # imageData is read from the image file if not stored in the label file
+    label_file = LabelFile(json_file)
+    img = utils.img_data_to_arr(label_file.imageData)
 
     label_name_to_value = {"_background_": 0}
-    for shape in sorted(data["shapes"], key=lambda x: x["label"]):
+    for shape in sorted(label_file.shapes, key=lambda x: x["label"]):
         label_name = shape["label"]
         if label_name in label_name_to_value:
             label_value = label_name_to_value[label_name]
         else:
             label_value = len(label_name_to_value)
             label_name_to_value[label_name] = label_value
-    lbl, _ = utils.shapes_to_label(img.shape, data["shapes"], label_name_to_value)
+    lbl, _ = utils.shapes_to_label(img.shape, label_file.shapes, label_name_to_value)
 
     label_names = [None] * (max(label_name_to_value.values()) + 1)
     for name, value in label_name_to_value.items():
@@ -0,0 +1,163 @@
+import argparse
+import concurrent.futures
+import os.path as osp
+import threading
+import time
+
+from qtpy import QtGui
+
+import labelme.ai
+from labelme import utils
+from labelme.config import get_config
+from labelme.image_prefetcher import load_image
+from labelme.image_scanner import iter_images
+from labelme.label_file import LabelFile
+from labelme.logger import logger
+
+_local = threading.local()
+
+
+def _get_model(model_name, ai_config):
+    # a model per thread, as a model keeps the state of the current image
+    if getattr(_local, "model", None) is None:
+        model = [
+            model
+            for model in labelme.ai.get_models(ai_config["models"])
+            if model.name == model_name
+        ][0]
+        _local.model = model(
+            embedding_cache=labelme.ai.create_embedding_cache(
+                ai_config["embedding_cache"]
+            ),
+            session_config=ai_config["session"],
+            max_image_size=ai_config["max_image_size"],
+        )
+    return _local.model
+
+
+def _compute_embeddings(model_name, ai_config, items):
+    model = _get_model(model_name, ai_config)
+    num_failed = 0
+    for filename, label_file in items:
+        try:
+            loaded = load_image(filename, label_file)
+            # same as the image given to the model in the app
+            model.set_image(
+                utils.img_qt_to_arr(loaded.image, max_size=model.max_image_size),
+                original_shape=(loaded.image.height(), loaded.image.width()),
+            )
+            if model.wait_image_embedding() is None:
+                raise RuntimeError("image embedding is not computed")
+        except Exception as e:
+            logger.error(
+                "Failed to compute image embedding of {!r}: {}".format(filename, e)
+            )
+            num_failed += 1
+    return len(items), num_failed
+
+
+def _get_label_file(filename, output_dir):
+    label_file = osp.splitext(filename)[0] + LabelFile.suffix
+    if output_dir:
+        label_file = osp.join(output_dir, osp.basename(label_file))
+    if osp.exists(label_file) and LabelFile.is_label_file(label_file):
+        return label_file
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute image embeddings of an AI model and store them in "
+        "the cache, so that the app skips computing them.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("dirpath", help="directory of images")
+    default_config_file = osp.join(osp.expanduser("~"), ".labelmerc")
+    parser.add_argument(
+        "--config",
+        default=default_config_file,
+        help="config file or yaml-format string",
+    )
+    parser.add_argument("--model", help="AI model (default: ai.default in config)")
+    parser.add_argument(
+        "--output",
+        "-O",
+        "-o",
+        help="directory of label files, whose image data is used if exists",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of workers, each of which loads the model",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="run workers as threads or processes",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=16, help="number of images per task"
+    )
+    args = parser.parse_args()
+
+    config = get_config(args.config)
+    model_name = args.model or config["ai"]["default"]
+    model_names = [
+        model.name for model in labelme.ai.get_models(config["ai"]["models"])
+    ]
+    if model_name not in model_names:
+        parser.error(
+            "unsupported model {!r}, choose from {}".format(model_name, model_names)
+        )
+    cache = labelme.ai.create_embedding_cache(config["ai"]["embedding_cache"])
+    if cache is None:
+        parser.error("ai.embedding_cache.enabled is false in config")
+
+    extensions = [
+        ".%s" % fmt.data().decode().lower()
+        for fmt in QtGui.QImageReader.supportedImageFormats()
+    ]
+    items = [
+        (filename, _get_label_file(filename, args.output) if has_label_file else None)
+        for filename, has_label_file in iter_images(
+            args.dirpath, extensions=extensions, output_dir=args.output
+        )
+    ]
+    logger.info("Found {} images in {!r}".format(len(items), args.dirpath))
+
+    if args.executor == "process":
+        Executor = concurrent.futures.ProcessPoolExecutor
+    else:
+        Executor = concurrent.futures.ThreadPoolExecutor
+    t_start = time.time()
+    num_done = num_failed = 0
+    with Executor(max_workers=max(1, args.workers)) as executor:
+        futures = [
+            executor.submit(
+                _compute_embeddings,
+                model_name,
+                config["ai"],
+                items[i : i + args.batch_size],
+            )
+            for i in range(0, len(items), args.batch_size)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            num_items, num_items_failed = future.result()
+            num_done += num_items
+            num_failed += num_items_failed
+            elapsed = time.time() - t_start
+            logger.info(
+                "Processed {}/{} images ({:.2f} s/image)".format(
+                    num_done, len(items), elapsed / num_done
+                )
+            )
+
+    if num_failed:
+        logger.warning("Failed to compute {} image embeddings".format(num_failed))
+    logger.info("Saved image embeddings to: {!r}".format(cache.cache_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import collections
+import concurrent.futures
+import functools
+import os
+import os.path as osp
+
+from qtpy import QtGui
+
+from labelme import utils
+from labelme.label_file import LabelFile
+from labelme.logger import logger
+
+LoadedImage = collections.namedtuple(
+    "LoadedImage", ["labelFile", "imageData", "imagePath", "image", "stamp"]
+)
+
+
+def _get_stamp(filename, label_file):
+    stamp = []
+    for f in [filename, label_file]:
+        try:
+            stat = os.stat(f) if f else None
+        except OSError:
+            stat = None
+        stamp.append(None if stat is None else (stat.st_mtime_ns, stat.st_size))
+    return tuple(stamp)
+
+
+def load_image(filename, label_file=None):
+    """Load an image file, or label_file if given, as LoadedImage.
+
+    This is safe to call from non-GUI threads, as it only creates QImage.
+    LabelFileError is raised if label_file is invalid.
+    """
+    stamp = _get_stamp(filename, label_file)
+    if label_file is not None:
+        labelFile = LabelFile(label_file)
+        imageData = labelFile.imageData
+        imagePath = osp.join(osp.dirname(label_file), labelFile.imagePath)
+        image = QtGui.QImage.fromData(imageData)
+    else:
+        labelFile = None
+        imageData, image_arr = LabelFile.read_image_file(filename)
+        imagePath = filename if imageData else None
+        if image_arr is None:
+            image = QtGui.QImage.fromData(imageData)
+        else:
+            # skip decoding imageData, which is re-encoded from image_arr
+            image = utils.img_arr_to_qt(image_arr)
+    return LoadedImage(
+        labelFile=labelFile,
+        imageData=imageData,
+        imagePath=imagePath,
+        image=image,
+        stamp=stamp,
+    )
+
+
+def _call_with_result(callback, future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        callback(future.result())
+    except Exception as e:
+        logger.error("Failed calling back for prefetched image: {}".format(e))
+
+
+def _get_nbytes(loaded):
+    image = loaded.image
+    if hasattr(image, "sizeInBytes"):
+        nbytes = image.sizeInBytes()
+    else:
+        nbytes = image.byteCount()
+    if loaded.imageData:
+        nbytes += len(loaded.imageData)
+    return nbytes
+
+
+class ImagePrefetcher(object):
+    """Load images in background threads ahead of when they are opened.
+
+    The loaded images are kept in an LRU cache bounded by `max_memory` in
+    bytes. An entry is discarded when the image or label file is modified
+    after it was loaded.
+    """
+
+    def __init__(self, num_workers=2, max_memory=512 * 2**20):
+        self.max_memory = max_memory
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, num_workers)
+        )
+        # key=(filename, label_file), value=Future of LoadedImage
+        self._cache = collections.OrderedDict()
+
+    def prefetch(self, items, callback=None):
+        """Start loading items of (filename, label_file) in order of priority.
+
+        Pending loads of items which are not in `items` are cancelled. If
+        given, callback(loaded) is called in the worker thread for each item
+        newly loaded.
+        """
+        items = list(items)
+        for key in list(self._cache):
+            future = self._cache[key]
+            if key not in items and future.cancel():
+                del self._cache[key]
+        for key in items:
+            if key not in self._cache:
+                self._cache[key] = self._executor.submit(load_image, *key)
+                if callback is not None:
+                    self._cache[key].add_done_callback(
+                        functools.partial(_call_with_result, callback)
+                    )
+        self._evict(keep=items)
+
+    def get(self, filename, label_file=None):
+        """Return the LoadedImage, waiting for or doing the load if needed."""
+        key = (filename, label_file)
+        future = self._cache.pop(key, None)
+        if future is not None and not future.cancel():
+            try:
+                loaded = future.result()
+            except Exception as e:
+                logger.debug("Failed prefetching {!r}: {}".format(filename, e))
+            else:
+                if loaded.stamp == _get_stamp(filename, label_file):
+                    self._cache[key] = future
+                    return loaded
+        loaded = load_image(filename, label_file)
+        self._cache[key] = concurrent.futures.Future()
+        self._cache[key].set_result(loaded)
+        self._evict(keep=[key])
+        return loaded
+
+    def clear(self):
+        for future in self._cache.values():
+            future.cancel()
+        self._cache.clear()
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
+
+    def _evict(self, keep):
+        nbytes = 0
+        for key in reversed(self._cache):
+            future = self._cache[key]
+            if not future.done() or future.cancelled() or future.exception():
+                continue
+            nbytes += _get_nbytes(future.result())
+        # evict from the least recently used
+        for key in list(self._cache):
+            if nbytes <= self.max_memory:
+                break
+            future = self._cache[key]
+            if key in keep or not future.done():
+                continue
+            if not future.cancelled() and not future.exception():
+                nbytes -= _get_nbytes(future.result())
+            del self._cache[key]
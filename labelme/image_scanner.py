@@ -0,0 +1,105 @@
+import os
+import os.path as osp
+import re
+import time
+
+import natsort
+from qtpy import QtCore
+
+from labelme.label_file import LabelFile
+
+
+def _list_names(dirpath):
+    try:
+        with os.scandir(dirpath) as it:
+            return list(it)
+    except OSError:
+        return []
+
+
+def iter_images(dirpath, extensions, output_dir=None, pattern=None):
+    """Yield (filename, has_label_file) of the images under dirpath.
+
+    The images are yielded in the natural order of their paths. Each
+    directory is listed once by os.scandir, and whether an image has its
+    label file is looked up in the listing instead of checking each file.
+    """
+    extensions = tuple(ext.lower() for ext in extensions)
+    if pattern is not None:
+        pattern = re.compile(pattern)
+    label_names = None
+    if output_dir:
+        label_names = {entry.name for entry in _list_names(output_dir)}
+    key = natsort.os_sort_keygen()
+
+    def iter_dir(dirpath):
+        entries = _list_names(dirpath)
+        names = {entry.name for entry in entries} if label_names is None else None
+        for entry in sorted(entries, key=lambda entry: key(entry.name)):
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_dir(entry.path)
+                continue
+            if not entry.name.lower().endswith(extensions):
+                continue
+            filename = osp.normpath(entry.path)
+            if pattern is not None and not pattern.search(filename):
+                continue
+            label_name = osp.splitext(entry.name)[0] + LabelFile.suffix
+            if label_names is None:
+                has_label_file = label_name in names
+            else:
+                has_label_file = label_name in label_names
+            yield filename, has_label_file
+
+    yield from iter_dir(dirpath)
+
+
+class ImageScanner(QtCore.QThread):
+    """Scan images under a directory in background and emit them by batches.
+
+    A batch is emitted when it has `batch_size` images or `batch_interval`
+    seconds passed since the last one, so that the first images are shown
+    immediately. Call requestInterruption() to cancel the scan.
+    """
+
+    imagesFound = QtCore.Signal(list)  # list of (filename, has_label_file)
+
+    def __init__(
+        self,
+        dirpath,
+        extensions,
+        output_dir=None,
+        pattern=None,
+        batch_size=1000,
+        batch_interval=0.1,
+        parent=None,
+    ):
+        super(ImageScanner, self).__init__(parent)
+        self.dirpath = dirpath
+        self.extensions = extensions
+        self.output_dir = output_dir
+        self.pattern = pattern
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+
+    def run(self):
+        batch = []
+        t_emitted = time.time()
+        for image in iter_images(
+            self.dirpath,
+            extensions=self.extensions,
+            output_dir=self.output_dir,
+            pattern=self.pattern,
+        ):
+            if self.isInterruptionRequested():
+                return
+            batch.append(image)
+            if (
+                len(batch) >= self.batch_size
+                or time.time() - t_emitted > self.batch_interval
+            ):
+                self.imagesFound.emit(batch)
+                batch = []
+                t_emitted = time.time()
+        if batch and not self.isInterruptionRequested():
+            self.imagesFound.emit(batch)
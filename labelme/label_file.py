@@ -1,9 +1,14 @@
 import base64
 import contextlib
+import functools
 import io
 import json
+import os
 import os.path as osp
+import shutil
+import uuid
 
+import numpy as np
 import PIL.Image
 
 from labelme import PY2
@@ -23,49 +28,266 @@ def open(name, mode):
         encoding = None
     else:
         encoding = "utf-8"
-    yield io.open(name, mode, encoding=encoding)
-    return
+    with io.open(name, mode, encoding=encoding) as f:
+        yield f
+
+
+def _fsync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _fsync_dir(dirname):
+    # a rename is durable once the directory is synced, which is not
+    # supported on some platforms such as Windows
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    try:
+        fd = os.open(dirname or ".", os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# replaced by the base64 of imageData while streaming it to the file
+_IMAGE_DATA_PLACEHOLDER = "__labelme_imageData_{}__".format(uuid.uuid4().hex)
+
+
+def _dump_json(data, f, imageData=None, chunk_size=3 * 2**16):
+    """Same as json.dump with indent=2, but writes imageData by chunks.
+
+    imageData is base64-encoded chunk by chunk in place of the placeholder
+    so that the whole encoded string is never held in memory.
+    """
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+    placeholder = encoder.encode(_IMAGE_DATA_PLACEHOLDER)
+    for chunk in encoder.iterencode(data):
+        if imageData is None or chunk != placeholder:
+            f.write(chunk)
+            continue
+        f.write('"')
+        # chunk_size is multiple of 3, so that the chunks concatenate exactly
+        for i in range(0, len(imageData), chunk_size):
+            f.write(base64.b64encode(imageData[i : i + chunk_size]).decode("utf-8"))
+        f.write('"')
 
 
 class LabelFileError(Exception):
     pass
 
 
+class _SidecarWriter(object):
+    """Collects imageData and masks to write them to a sidecar binary file.
+
+    The sidecar file is the raw concatenation of the items aligned to
+    `alignment` bytes, and the label file keeps a reference to each item with
+    its offset, so that they can be read by memory mapping the sidecar file.
+    Masks are stored as bits packed by `np.packbits`.
+    """
+
+    alignment = 64
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._chunks = []
+        self._offset = 0
+
+    def add_bytes(self, data):
+        return self._add(data)
+
+    def add_mask(self, mask):
+        mask = np.asarray(mask, dtype=bool)
+        ref = self._add(np.packbits(mask, axis=None).tobytes())
+        ref["shape"] = list(mask.shape)
+        ref["dtype"] = "packbits"
+        return ref
+
+    def _add(self, data):
+        padding = -self._offset % self.alignment
+        if padding:
+            self._chunks.append(b"\0" * padding)
+            self._offset += padding
+        ref = dict(
+            sidecar=osp.basename(self.filename),
+            offset=self._offset,
+            length=len(data),
+        )
+        self._chunks.append(data)
+        self._offset += len(data)
+        return ref
+
+    def write(self):
+        try:
+            with io.open(self.filename, "wb") as f:
+                for chunk in self._chunks:
+                    f.write(chunk)
+                _fsync(f)
+        except Exception:
+            self.remove()
+            raise
+
+    def remove(self):
+        if osp.exists(self.filename):
+            os.remove(self.filename)
+
+
+def _is_sidecar_ref(value):
+    return isinstance(value, dict) and "sidecar" in value
+
+
+def _get_sidecar_files(filename):
+    """Return the sidecar files referenced by the label file `filename`."""
+    with open(filename, "r") as f:
+        data = json.load(f)
+    refs = [data.get("imageData")] + [
+        shape.get("mask") for shape in data.get("shapes") or []
+    ]
+    return {
+        osp.join(osp.dirname(filename), ref["sidecar"])
+        for ref in refs
+        if _is_sidecar_ref(ref)
+        # never a file out of the directory of the label file
+        and ref["sidecar"] == osp.basename(ref["sidecar"])
+        and ref["sidecar"].endswith(LabelFile.sidecar_suffix)
+    }
+
+
+def _read_sidecar(filename, ref, length=None):
+    """Read imageData or a mask referenced from the label file `filename`."""
+    sidecar_file = osp.join(osp.dirname(filename), ref["sidecar"])
+    if length is None:
+        length = ref["length"]
+    length = min(length, ref["length"])
+    if length == 0:
+        data = np.zeros((0,), dtype=np.uint8)
+    else:
+        data = np.memmap(
+            sidecar_file,
+            dtype=np.uint8,
+            mode="r",
+            offset=ref["offset"],
+            shape=(length,),
+        )
+    if ref.get("dtype") == "packbits":
+        shape = ref["shape"]
+        mask = np.unpackbits(data, count=int(np.prod(shape)))
+        return mask.reshape(shape).astype(bool)
+    return data.tobytes()
+
+
+def _get_exif_oriented_size(image_pil):
+    """Return (height, width) of a lazily opened image after EXIF orientation.
+
+    Only the image header is read, the pixels are not decoded.
+    """
+    width, height = image_pil.size
+    try:
+        exif = image_pil._getexif()
+    except AttributeError:
+        exif = None
+    # 0x0112: Orientation, and 5-8 are the ones that transpose the image
+    if exif and exif.get(0x0112) in [5, 6, 7, 8]:
+        width, height = height, width
+    return height, width
+
+
 class LabelFile(object):
     suffix = ".json"
+    sidecar_suffix = ".labelme.bin"
 
-    def __init__(self, filename=None):
+    # size of the base64 prefix decoded to read the header of embedded imageData
+    _header_b64_length = 4 * 2**15
+
+    def __init__(self, filename=None, load_image=True):
         self.shapes = []
         self.imagePath = None
         self.imageData = None
+        self.imageHeight = None
+        self.imageWidth = None
         if filename is not None:
-            self.load(filename)
+            self.load(filename, load_image=load_image)
         self.filename = filename
 
+    @property
+    def imageData(self):
+        if self._imageDataLoader is not None:
+            try:
+                imageData = self._imageDataLoader()
+            except Exception as e:
+                raise LabelFileError(e)
+            if imageData is None:
+                raise LabelFileError(
+                    "Failed to load image data of {!r}".format(self.filename)
+                )
+            self._imageData = imageData
+            self._imageDataLoader = None
+        return self._imageData
+
+    @imageData.setter
+    def imageData(self, value):
+        self._imageData = value
+        self._imageDataLoader = None
+
     @staticmethod
     def load_image_file(filename):
+        imageData, _ = LabelFile.read_image_file(filename)
+        return imageData
+
+    @staticmethod
+    def read_image_file(filename):
+        """Read an image file as (imageData, image_arr).
+
+        imageData is the original file content if it is PNG or JPEG and no EXIF
+        orientation needs to be applied, and image_arr is None in that case.
+        Otherwise, image_arr is the re-oriented image, which can be converted
+        to QImage directly, and imageData is it encoded as PNG or JPEG.
+        """
         try:
             image_pil = PIL.Image.open(filename)
         except IOError:
             logger.error("Failed opening image file: {}".format(filename))
-            return
+            return None, None
 
-        # apply orientation to image according to exif
-        image_pil = utils.apply_exif_orientation(image_pil)
+        with image_pil:
+            # apply orientation to image according to exif
+            image_pil_oriented = utils.apply_exif_orientation(image_pil)
 
-        with io.BytesIO() as f:
-            ext = osp.splitext(filename)[1].lower()
-            if PY2 and QT4:
-                format = "PNG"
-            elif ext in [".jpg", ".jpeg"]:
-                format = "JPEG"
-            else:
-                format = "PNG"
-            image_pil.save(f, format=format)
-            f.seek(0)
-            return f.read()
+            # other formats such as BMP and TIFF are re-encoded, as imageData
+            # is stored in label files
+            if (
+                image_pil_oriented is image_pil
+                and image_pil.format in ["PNG", "JPEG"]
+                and not (PY2 and QT4)
+            ):
+                with io.open(filename, "rb") as f:
+                    return f.read(), None
+
+            with io.BytesIO() as f:
+                ext = osp.splitext(filename)[1].lower()
+                if PY2 and QT4:
+                    format = "PNG"
+                elif ext in [".jpg", ".jpeg"]:
+                    format = "JPEG"
+                else:
+                    format = "PNG"
+                image_pil_oriented.save(f, format=format)
+                f.seek(0)
+                imageData = f.read()
 
-    def load(self, filename):
+            if image_pil_oriented.mode not in ["L", "RGB", "RGBA"]:
+                image_pil_oriented = image_pil_oriented.convert("RGBA")
+            return imageData, np.asarray(image_pil_oriented)
+
+    def load_meta(self, filename):
+        """Load only metadata and shapes, and defer imageData until accessed."""
+        self.load(filename, load_image=False)
+
+    def load(self, filename, load_image=True):
         keys = [
             "version",
             "imageData",
@@ -88,21 +310,35 @@ class LabelFile(object):
             with open(filename, "r") as f:
                 data = json.load(f)
 
-            if data["imageData"] is not None:
-                imageData = base64.b64decode(data["imageData"])
-                if PY2 and QT4:
-                    imageData = utils.img_data_to_png_data(imageData)
-            else:
-                # relative path from label file to relative path from cwd
-                imagePath = osp.join(osp.dirname(filename), data["imagePath"])
-                imageData = self.load_image_file(imagePath)
-            flags = data.get("flags") or {}
             imagePath = data["imagePath"]
-            self._check_image_height_and_width(
-                base64.b64encode(imageData).decode("utf-8"),
-                data.get("imageHeight"),
-                data.get("imageWidth"),
-            )
+            flags = data.get("flags") or {}
+            if load_image:
+                imageData = self._load_image_data(
+                    filename, data["imageData"], imagePath
+                )
+                imageHeight, imageWidth = self._check_image_height_and_width(
+                    imageData,
+                    data.get("imageHeight"),
+                    data.get("imageWidth"),
+                )
+                imageDataLoader = None
+            else:
+                imageData = None
+                try:
+                    imageHeight, imageWidth = self._read_image_size(
+                        filename, data["imageData"], imagePath
+                    )
+                except Exception as e:
+                    # the image is not needed until imageData is accessed,
+                    # which raises then
+                    logger.warning(
+                        "Failed to read image size of {!r}: {}".format(filename, e)
+                    )
+                    imageHeight = data.get("imageHeight")
+                    imageWidth = data.get("imageWidth")
+                imageDataLoader = functools.partial(
+                    self._load_image_data, filename, data["imageData"], imagePath
+                )
             shapes = [
                 dict(
                     label=s["label"],
@@ -111,7 +347,7 @@ class LabelFile(object):
                     flags=s.get("flags", {}),
                     description=s.get("description"),
                     group_id=s.get("group_id"),
-                    mask=utils.img_b64_to_arr(s["mask"]) if s.get("mask") else None,
+                    mask=self._load_mask(filename, s.get("mask")),
                     other_data={k: v for k, v in s.items() if k not in shape_keys},
                 )
                 for s in data["shapes"]
@@ -129,24 +365,76 @@ class LabelFile(object):
         self.shapes = shapes
         self.imagePath = imagePath
         self.imageData = imageData
+        self._imageDataLoader = imageDataLoader
+        self.imageHeight = imageHeight
+        self.imageWidth = imageWidth
         self.filename = filename
         self.otherData = otherData
 
+    @staticmethod
+    def _load_mask(filename, mask):
+        if not mask:
+            return None
+        if _is_sidecar_ref(mask):
+            return _read_sidecar(filename, mask)
+        return utils.img_b64_to_arr(mask)
+
+    def _load_image_data(self, filename, imageData, imagePath):
+        if _is_sidecar_ref(imageData):
+            imageData = _read_sidecar(filename, imageData)
+            if PY2 and QT4:
+                imageData = utils.img_data_to_png_data(imageData)
+        elif imageData is not None:
+            imageData = base64.b64decode(imageData)
+            if PY2 and QT4:
+                imageData = utils.img_data_to_png_data(imageData)
+        else:
+            # relative path from label file to relative path from cwd
+            imagePath = osp.join(osp.dirname(filename), imagePath)
+            imageData = self.load_image_file(imagePath)
+        return imageData
+
+    def _read_image_size(self, filename, imageData, imagePath):
+        if _is_sidecar_ref(imageData):
+            try:
+                header = _read_sidecar(
+                    filename, imageData, length=self._header_b64_length
+                )
+                width, height = utils.img_data_to_pil(header).size
+            except Exception:
+                width, height = utils.img_data_to_pil(
+                    _read_sidecar(filename, imageData)
+                ).size
+            return height, width
+        elif imageData is not None:
+            # decode only the beginning of imageData, which has the header
+            try:
+                header = base64.b64decode(imageData[: self._header_b64_length])
+                width, height = utils.img_data_to_pil(header).size
+            except Exception:
+                width, height = utils.img_data_to_pil(base64.b64decode(imageData)).size
+            return height, width
+
+        # relative path from label file to relative path from cwd
+        imagePath = osp.join(osp.dirname(filename), imagePath)
+        with PIL.Image.open(imagePath) as image_pil:
+            return _get_exif_oriented_size(image_pil)
+
     @staticmethod
     def _check_image_height_and_width(imageData, imageHeight, imageWidth):
-        img_arr = utils.img_b64_to_arr(imageData)
-        if imageHeight is not None and img_arr.shape[0] != imageHeight:
+        actualWidth, actualHeight = utils.img_data_to_pil(imageData).size
+        if imageHeight is not None and actualHeight != imageHeight:
             logger.error(
                 "imageHeight does not match with imageData or imagePath, "
                 "so getting imageHeight from actual image."
             )
-            imageHeight = img_arr.shape[0]
-        if imageWidth is not None and img_arr.shape[1] != imageWidth:
+            imageHeight = actualHeight
+        if imageWidth is not None and actualWidth != imageWidth:
             logger.error(
                 "imageWidth does not match with imageData or imagePath, "
                 "so getting imageWidth from actual image."
             )
-            imageWidth = img_arr.shape[1]
+            imageWidth = actualWidth
         return imageHeight, imageWidth
 
     def save(
@@ -159,35 +447,126 @@ class LabelFile(object):
         imageData=None,
         otherData=None,
         flags=None,
+        sidecar=False,
     ):
-        if imageData is not None:
-            imageData = base64.b64encode(imageData).decode("utf-8")
-            imageHeight, imageWidth = self._check_image_height_and_width(
-                imageData, imageHeight, imageWidth
-            )
+        """Save the label file.
+
+        The mask of each shape can be given as a bool array or base64 PNG. If
+        sidecar is True, imageData and the masks are stored in a binary file
+        next to the label file (see `sidecar_suffix`), which the label file
+        references, instead of being embedded with base64. Each save writes a
+        sidecar file of a new name, and the one of the previous label file is
+        removed only after the label file is replaced.
+        """
+        if imageData is not None and (imageHeight is None or imageWidth is None):
+            # the size is usually given from the loaded QImage, otherwise read it
+            # from the image header
+            width, height = utils.img_data_to_pil(imageData).size
+            imageHeight = height if imageHeight is None else imageHeight
+            imageWidth = width if imageWidth is None else imageWidth
         if otherData is None:
             otherData = {}
         if flags is None:
             flags = {}
+
+        sidecar_writer = None
+        if sidecar:
+            sidecar_writer = _SidecarWriter(
+                "{}.{}{}".format(
+                    osp.splitext(filename)[0], uuid.uuid4().hex, self.sidecar_suffix
+                )
+            )
+        try:
+            shapes = [self._format_shape(s, sidecar_writer, filename) for s in shapes]
+        except Exception as e:
+            raise LabelFileError(e)
+        if imageData is None:
+            imageDataToDump = None
+        elif sidecar_writer is not None:
+            imageDataToDump = sidecar_writer.add_bytes(imageData)
+            imageData = None
+        else:
+            imageDataToDump = _IMAGE_DATA_PLACEHOLDER
+
         data = dict(
             version=__version__,
             flags=flags,
             shapes=shapes,
             imagePath=imagePath,
-            imageData=imageData,
+            imageData=imageDataToDump,
             imageHeight=imageHeight,
             imageWidth=imageWidth,
         )
         for key, value in otherData.items():
             assert key not in data
             data[key] = value
+        old_sidecar_files = set()
+        if osp.exists(filename):
+            try:
+                old_sidecar_files = _get_sidecar_files(filename)
+            except Exception as e:
+                logger.warning(
+                    "Failed to read sidecar files of {!r}: {}".format(filename, e)
+                )
+        if sidecar_writer is not None:
+            old_sidecar_files.discard(sidecar_writer.filename)
+
+        # write to a temporary file and rename it, so that a crash while saving
+        # never leaves a truncated label file
+        tmp_filename = "{}.{}.tmp".format(filename, uuid.uuid4().hex[:8])
         try:
-            with open(filename, "w") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            try:
+                # the sidecar file goes first, so the label file never
+                # references missing data
+                if sidecar_writer is not None:
+                    sidecar_writer.write()
+                with open(tmp_filename, "w") as f:
+                    _dump_json(data, f, imageData=imageData)
+                    # on disk before the rename, which may be committed first
+                    # on power loss otherwise
+                    _fsync(f)
+                if osp.exists(filename):
+                    shutil.copymode(filename, tmp_filename)
+                os.replace(tmp_filename, filename)
+                _fsync_dir(osp.dirname(filename))
+            except Exception:
+                # the previous label file and its sidecar file are kept
+                if sidecar_writer is not None:
+                    sidecar_writer.remove()
+                raise
+            finally:
+                if osp.exists(tmp_filename):
+                    os.remove(tmp_filename)
             self.filename = filename
         except Exception as e:
             raise LabelFileError(e)
 
+        for sidecar_file in old_sidecar_files:
+            try:
+                os.remove(sidecar_file)
+            except OSError as e:
+                logger.warning(
+                    "Failed to remove sidecar file {!r}: {}".format(sidecar_file, e)
+                )
+
+    @staticmethod
+    def _format_shape(shape, sidecar_writer=None, filename=None):
+        mask = shape.get("mask")
+        if mask is None or isinstance(mask, str):
+            return shape
+        if _is_sidecar_ref(mask):
+            # read from the sidecar file next to the label file, which is
+            # removed once the label file is replaced
+            if filename is None:
+                raise ValueError("mask references a sidecar file: {}".format(mask))
+            mask = _read_sidecar(filename, mask)
+        shape = dict(shape)
+        if sidecar_writer is None:
+            shape["mask"] = utils.img_arr_to_b64(mask)
+        else:
+            shape["mask"] = sidecar_writer.add_mask(mask)
+        return shape
+
     @staticmethod
     def is_label_file(filename):
         return osp.splitext(filename)[1].lower() == LabelFile.suffix
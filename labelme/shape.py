@@ -6,12 +6,8 @@ import skimage.measure
 from qtpy import QtCore
 from qtpy import QtGui
 
-import labelme.utils
 from labelme.logger import logger
 
-# TODO(unknown):
-# - [opt] Store paths instead of creating new ones at each paint.
-
 
 class Shape(object):
     # Render handles as squares
@@ -47,6 +43,11 @@ class Shape(object):
         description=None,
         mask=None,
     ):
+        # geometry such as paths is cached until the version is incremented
+        # by changing the points, shape_type or closedness
+        self._version = 0
+        self._cache = {}
+
         self.label = label
         self.group_id = group_id
         self.points = []
@@ -77,6 +78,41 @@ class Shape(object):
             # is used for drawing the pending line a different color.
             self.line_color = line_color
 
+    @property
+    def mask(self):
+        return self._mask
+
+    @mask.setter
+    def mask(self, value):
+        self._mask = value
+        # rendered at the first paint and kept until the mask is changed
+        self._mask_image = None  # (fill color, ARGB32 array, QImage)
+        self._mask_outline = None
+
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, value):
+        self._points = value
+        self._version += 1
+
+    def __getstate__(self):
+        # the cache of Qt objects, which cannot be copied, is dropped
+        state = self.__dict__.copy()
+        state["_cache"] = {}
+        state["_mask_image"] = None
+        state["_mask_outline"] = None
+        return state
+
+    def _getCached(self, name, key, build):
+        key = (self._version,) + key
+        cached = self._cache.get(name)
+        if cached is None or cached[0] != key:
+            cached = self._cache[name] = (key, build())
+        return cached[1]
+
     def setShapeRefined(self, shape_type, points, point_labels, mask=None):
         self._shape_raw = (self.shape_type, self.points, self.point_labels)
         self.shape_type = shape_type
@@ -110,9 +146,11 @@ class Shape(object):
         ]:
             raise ValueError("Unexpected shape_type: {}".format(value))
         self._shape_type = value
+        self._version += 1
 
     def close(self):
         self._closed = True
+        self._version += 1
 
     def addPoint(self, point, label=1):
         if self.points and point == self.points[0]:
@@ -120,6 +158,7 @@ class Shape(object):
         else:
             self.points.append(point)
             self.point_labels.append(label)
+            self._version += 1
 
     def canAddPoint(self):
         return self.shape_type in ["polygon", "linestrip"]
@@ -128,12 +167,14 @@ class Shape(object):
         if self.points:
             if self.point_labels:
                 self.point_labels.pop()
+            self._version += 1
             return self.points.pop()
         return None
 
     def insertPoint(self, i, point, label=1):
         self.points.insert(i, point)
         self.point_labels.insert(i, label)
+        self._version += 1
 
     def removePoint(self, i):
         if not self.canAddPoint():
@@ -161,19 +202,26 @@ class Shape(object):
 
         self.points.pop(i)
         self.point_labels.pop(i)
+        self._version += 1
 
     def isClosed(self):
         return self._closed
 
     def setOpen(self):
         self._closed = False
+        self._version += 1
 
     def getRectFromLine(self, pt1, pt2):
         x1, y1 = pt1.x(), pt1.y()
         x2, y2 = pt2.x(), pt2.y()
         return QtCore.QRectF(x1, y1, x2 - x1, y2 - y1)
 
-    def paint(self, painter):
+    def paint(self, painter, simplified=False):
+        """Paint the shape, or paint it faster with less detail if simplified.
+
+        When simplified, the vertices are not drawn except for points, and
+        polygons and linestrips are approximated within a pixel on screen.
+        """
         if self.mask is None and not self.points:
             return
 
@@ -184,78 +232,55 @@ class Shape(object):
         painter.setPen(pen)
 
         if self.mask is not None:
-            image_to_draw = np.zeros(self.mask.shape + (4,), dtype=np.uint8)
-            fill_color = (
-                self.select_fill_color.getRgb()
-                if self.selected
-                else self.fill_color.getRgb()
-            )
-            image_to_draw[self.mask] = fill_color
-            qimage = QtGui.QImage.fromData(labelme.utils.img_arr_to_data(image_to_draw))
+            fill_color = self.select_fill_color if self.selected else self.fill_color
             painter.drawImage(
                 int(round(self.points[0].x())),
                 int(round(self.points[0].y())),
-                qimage,
+                self._getMaskImage(fill_color),
             )
-
-            line_path = QtGui.QPainterPath()
-            contours = skimage.measure.find_contours(np.pad(self.mask, pad_width=1))
-            for contour in contours:
-                contour += [self.points[0].y(), self.points[0].x()]
-                line_path.moveTo(contour[0, 1], contour[0, 0])
-                for point in contour[1:]:
-                    line_path.lineTo(point[1], point[0])
-            painter.drawPath(line_path)
+            painter.translate(self.points[0])
+            painter.drawPath(self._getMaskOutline())
+            painter.translate(-self.points[0])
 
         if self.points:
-            line_path = QtGui.QPainterPath()
-            vrtx_path = QtGui.QPainterPath()
-            negative_vrtx_path = QtGui.QPainterPath()
-
-            if self.shape_type in ["rectangle", "mask"]:
-                assert len(self.points) in [1, 2]
-                if len(self.points) == 2:
-                    rectangle = self.getRectFromLine(*self.points)
-                    line_path.addRect(rectangle)
-                if self.shape_type == "rectangle":
-                    for i in range(len(self.points)):
-                        self.drawVertex(vrtx_path, i)
-            elif self.shape_type == "circle":
-                assert len(self.points) in [1, 2]
-                if len(self.points) == 2:
-                    rectangle = self.getCircleRectFromLine(self.points)
-                    line_path.addEllipse(rectangle)
-                for i in range(len(self.points)):
-                    self.drawVertex(vrtx_path, i)
-            elif self.shape_type == "linestrip":
-                line_path.moveTo(self.points[0])
-                for i, p in enumerate(self.points):
-                    line_path.lineTo(p)
-                    self.drawVertex(vrtx_path, i)
-            elif self.shape_type == "points":
-                assert len(self.points) == len(self.point_labels)
-                for i, point_label in enumerate(self.point_labels):
-                    if point_label == 1:
-                        self.drawVertex(vrtx_path, i)
-                    else:
-                        self.drawVertex(negative_vrtx_path, i)
+            if simplified and self.shape_type in ["polygon", "linestrip"]:
+                # tolerance in image pixels, which is quantized to reuse the
+                # path while zooming
+                tolerance = 2.0 ** math.floor(math.log2(1.0 / self.scale))
+                line_path = self._getCached(
+                    "simplified_line_path",
+                    (tolerance,),
+                    lambda: self._makeSimplifiedLinePath(tolerance),
+                )
             else:
-                line_path.moveTo(self.points[0])
-                # Uncommenting the following line will draw 2 paths
-                # for the 1st vertex, and make it non-filled, which
-                # may be desirable.
-                # self.drawVertex(vrtx_path, 0)
-
-                for i, p in enumerate(self.points):
-                    line_path.lineTo(p)
-                    self.drawVertex(vrtx_path, i)
-                if self.isClosed():
-                    line_path.lineTo(self.points[0])
+                line_path = self._getCached("line_path", (), self._makeLinePath)
+            if simplified and self.shape_type not in ["point", "points"]:
+                painter.drawPath(line_path)
+                if self.fill and self.mask is None:
+                    color = self.select_fill_color if self.selected else self.fill_color
+                    painter.fillPath(line_path, color)
+                return
+
+            vrtx_path, negative_vrtx_path = self._getCached(
+                "vertex_paths",
+                (
+                    self.scale,
+                    self.point_size,
+                    self.point_type,
+                    self._highlightIndex,
+                    self._highlightMode,
+                    tuple(self.point_labels),
+                ),
+                self._makeVertexPaths,
+            )
 
             painter.drawPath(line_path)
             if vrtx_path.length() > 0:
                 painter.drawPath(vrtx_path)
-                painter.fillPath(vrtx_path, self._vertex_fill_color)
+                if self._highlightIndex is not None:
+                    painter.fillPath(vrtx_path, self.hvertex_fill_color)
+                else:
+                    painter.fillPath(vrtx_path, self.vertex_fill_color)
             if self.fill and self.mask is None:
                 color = self.select_fill_color if self.selected else self.fill_color
                 painter.fillPath(line_path, color)
@@ -265,6 +290,92 @@ class Shape(object):
             painter.drawPath(negative_vrtx_path)
             painter.fillPath(negative_vrtx_path, QtGui.QColor(255, 0, 0, 255))
 
+    def _makeLinePath(self):
+        line_path = QtGui.QPainterPath()
+        if self.shape_type in ["rectangle", "mask"]:
+            assert len(self.points) in [1, 2]
+            if len(self.points) == 2:
+                rectangle = self.getRectFromLine(*self.points)
+                line_path.addRect(rectangle)
+        elif self.shape_type == "circle":
+            assert len(self.points) in [1, 2]
+            if len(self.points) == 2:
+                rectangle = self.getCircleRectFromLine(self.points)
+                line_path.addEllipse(rectangle)
+        elif self.shape_type == "linestrip":
+            line_path.moveTo(self.points[0])
+            for p in self.points:
+                line_path.lineTo(p)
+        elif self.shape_type != "points":
+            line_path.moveTo(self.points[0])
+            for p in self.points:
+                line_path.lineTo(p)
+            if self.isClosed():
+                line_path.lineTo(self.points[0])
+        return line_path
+
+    def _makeSimplifiedLinePath(self, tolerance):
+        points = self._getPointsArray()
+        if self.shape_type == "polygon" and self.isClosed():
+            points = np.vstack([points, points[:1]])
+        points = skimage.measure.approximate_polygon(points, tolerance=tolerance)
+        line_path = QtGui.QPainterPath()
+        line_path.addPolygon(QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in points]))
+        return line_path
+
+    def _makeVertexPaths(self):
+        vrtx_path = QtGui.QPainterPath()
+        negative_vrtx_path = QtGui.QPainterPath()
+        if self.shape_type == "mask":
+            pass
+        elif self.shape_type == "points":
+            assert len(self.points) == len(self.point_labels)
+            for i, point_label in enumerate(self.point_labels):
+                if point_label == 1:
+                    self.drawVertex(vrtx_path, i)
+                else:
+                    self.drawVertex(negative_vrtx_path, i)
+        else:
+            # Uncommenting the following line will draw 2 paths
+            # for the 1st vertex, and make it non-filled, which
+            # may be desirable.
+            # self.drawVertex(vrtx_path, 0)
+            for i in range(len(self.points)):
+                self.drawVertex(vrtx_path, i)
+        return vrtx_path, negative_vrtx_path
+
+    def _getMaskImage(self, fill_color):
+        rgba = fill_color.getRgb()
+        if self._mask_image is None or self._mask_image[0] != rgba:
+            r, g, b, a = rgba
+            # premultiplied ARGB32, which is the fastest format to draw, and
+            # the QImage shares the memory of the array
+            argb = np.zeros(self.mask.shape, dtype=np.uint32)
+            argb[self.mask] = (
+                (a << 24) | (r * a // 255 << 16) | (g * a // 255 << 8) | b * a // 255
+            )
+            height, width = argb.shape
+            image = QtGui.QImage(
+                argb.data,
+                width,
+                height,
+                argb.strides[0],
+                QtGui.QImage.Format_ARGB32_Premultiplied,
+            )
+            self._mask_image = (rgba, argb, image)
+        return self._mask_image[2]
+
+    def _getMaskOutline(self):
+        if self._mask_outline is None:
+            line_path = QtGui.QPainterPath()
+            contours = skimage.measure.find_contours(np.pad(self.mask, pad_width=1))
+            for contour in contours:
+                line_path.moveTo(contour[0, 1], contour[0, 0])
+                for point in contour[1:]:
+                    line_path.lineTo(point[1], point[0])
+            self._mask_outline = line_path
+        return self._mask_outline
+
     def drawVertex(self, path, i):
         d = self.point_size / self.scale
         shape = self.point_type
@@ -283,26 +394,50 @@ class Shape(object):
         else:
             assert False, "unsupported vertex shape"
 
+    def _getPointsArray(self):
+        # (N, 2) float64 array of the points, kept in sync by the version
+        return self._getCached(
+            "points_array",
+            (),
+            lambda: np.array(
+                [(p.x(), p.y()) for p in self.points], dtype=np.float64
+            ).reshape(-1, 2),
+        )
+
     def nearestVertex(self, point, epsilon):
-        min_distance = float("inf")
-        min_i = None
-        for i, p in enumerate(self.points):
-            dist = labelme.utils.distance(p - point)
-            if dist <= epsilon and dist < min_distance:
-                min_distance = dist
-                min_i = i
-        return min_i
+        points = self._getPointsArray()
+        if len(points) == 0:
+            return None
+        distances = np.hypot(points[:, 0] - point.x(), points[:, 1] - point.y())
+        i = int(np.argmin(distances))
+        if distances[i] > epsilon:
+            return None
+        return i
 
     def nearestEdge(self, point, epsilon):
-        min_distance = float("inf")
-        post_i = None
-        for i in range(len(self.points)):
-            line = [self.points[i - 1], self.points[i]]
-            dist = labelme.utils.distancetoline(point, line)
-            if dist <= epsilon and dist < min_distance:
-                min_distance = dist
-                post_i = i
-        return post_i
+        # edge i is from vertex i - 1 to vertex i
+        points2 = self._getPointsArray()
+        if len(points2) == 0:
+            return None
+        points1 = np.roll(points2, 1, axis=0)
+        point = np.array([point.x(), point.y()])
+        edges = points2 - points1
+        offsets = point - points1
+        lengths = (edges**2).sum(axis=1)
+        t = np.divide(
+            (offsets * edges).sum(axis=1),
+            lengths,
+            out=np.zeros_like(lengths),
+            where=lengths > 0,
+        )
+        # the distance to the nearest end if projected outside the edge
+        t = np.clip(t, 0, 1)[:, None]
+        offsets = np.where(t == 1, point - points2, offsets - edges * t)
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        i = int(np.argmin(distances))
+        if distances[i] > epsilon:
+            return None
+        return i
 
     def containsPoint(self, point):
         if self.mask is not None:
@@ -330,6 +465,9 @@ class Shape(object):
         return rectangle
 
     def makePath(self):
+        return self._getCached("path", (), self._makePath)
+
+    def _makePath(self):
         if self.shape_type in ["rectangle", "mask"]:
             path = QtGui.QPainterPath()
             if len(self.points) == 2:
@@ -347,13 +485,16 @@ class Shape(object):
         return path
 
     def boundingRect(self):
-        return self.makePath().boundingRect()
+        return QtCore.QRectF(
+            self._getCached("bounding_rect", (), lambda: self.makePath().boundingRect())
+        )
 
     def moveBy(self, offset):
         self.points = [p + offset for p in self.points]
 
     def moveVertexBy(self, i, offset):
         self.points[i] = self.points[i] + offset
+        self._version += 1
 
     def highlightVertex(self, i, action):
         """Highlight a vertex appropriately based on the current action
@@ -381,3 +522,4 @@ class Shape(object):
 
     def __setitem__(self, key, value):
         self.points[key] = value
+        self._version += 1
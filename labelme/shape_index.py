@@ -0,0 +1,135 @@
+import collections
+import math
+
+
+class ShapeIndex(object):
+    """Grid index of shapes by their bounding boxes for hit-testing.
+
+    `update` re-indexes only the shapes added or changed since the last call,
+    which are found by the version of the shapes, and `refresh` re-indexes
+    the given shapes only, for edits that do not change the list of shapes.
+    `query` returns the shapes near a point from the cells around it instead
+    of all shapes.
+    Shapes spanning more than `max_cells` cells are kept out of the grid and
+    always returned as candidates.
+    """
+
+    def __init__(self, cell_size=64, max_cells=256):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        # id(shape): [shape, version, order, rect, cells]
+        self._entries = {}
+        self._cells = collections.defaultdict(set)
+        self._large = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, shapes):
+        """Index shapes, whose order is that of hit-testing in reverse."""
+        entries = {}
+        for order, shape in enumerate(shapes):
+            key = id(shape)
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] is not shape or entry[1] != shape._version:
+                if entry is not None:
+                    self._remove(key, entry)
+                entry = self._insert(key, shape)
+            entry[2] = order
+            entries[key] = entry
+        for key, entry in self._entries.items():
+            self._remove(key, entry)
+        self._entries = entries
+
+    def refresh(self, shapes):
+        """Re-index the changed ones of shapes, which are already indexed."""
+        for shape in shapes:
+            key = id(shape)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is not shape or entry[1] == shape._version:
+                continue
+            self._remove(key, entry)
+            order = entry[2]
+            entry = self._entries[key] = self._insert(key, shape)
+            entry[2] = order
+
+    def query(self, x, y, margin=0):
+        """Return shapes whose bounding box is within margin of (x, y).
+
+        The shapes are ordered from the last one in the shapes of `update`.
+        """
+        keys = set(self._large)
+        i1, j1 = self._cell(x - margin, y - margin)
+        i2, j2 = self._cell(x + margin, y + margin)
+        for i in range(i1, i2 + 1):
+            for j in range(j1, j2 + 1):
+                keys.update(self._cells.get((i, j), ()))
+
+        entries = []
+        for key in keys:
+            entry = self._entries[key]
+            x1, y1, x2, y2 = entry[3]
+            if x1 - margin <= x <= x2 + margin and y1 - margin <= y <= y2 + margin:
+                entries.append(entry)
+        entries.sort(key=lambda entry: entry[2], reverse=True)
+        return [entry[0] for entry in entries]
+
+    def query_rect(self, x1, y1, x2, y2, margin=0):
+        """Return shapes whose bounding box is within margin of the rectangle.
+
+        The shapes are ordered as in the shapes of `update`.
+        """
+        x1, y1, x2, y2 = x1 - margin, y1 - margin, x2 + margin, y2 + margin
+        i1, j1 = self._cell(x1, y1)
+        i2, j2 = self._cell(x2, y2)
+        if (i2 - i1 + 1) * (j2 - j1 + 1) > len(self._entries):
+            # fewer shapes than cells in the rectangle
+            entries = self._entries.values()
+        else:
+            keys = set(self._large)
+            for i in range(i1, i2 + 1):
+                for j in range(j1, j2 + 1):
+                    keys.update(self._cells.get((i, j), ()))
+            entries = [self._entries[key] for key in keys]
+
+        entries = [
+            entry
+            for entry in entries
+            if entry[3][0] <= x2
+            and x1 <= entry[3][2]
+            and entry[3][1] <= y2
+            and y1 <= entry[3][3]
+        ]
+        entries.sort(key=lambda entry: entry[2])
+        return [entry[0] for entry in entries]
+
+    def _cell(self, x, y):
+        return (
+            int(math.floor(x / self.cell_size)),
+            int(math.floor(y / self.cell_size)),
+        )
+
+    def _insert(self, key, shape):
+        rect = shape.boundingRect()
+        rect = (rect.left(), rect.top(), rect.right(), rect.bottom())
+        i1, j1 = self._cell(rect[0], rect[1])
+        i2, j2 = self._cell(rect[2], rect[3])
+        if (i2 - i1 + 1) * (j2 - j1 + 1) > self.max_cells:
+            cells = None
+            self._large.add(key)
+        else:
+            cells = [(i, j) for i in range(i1, i2 + 1) for j in range(j1, j2 + 1)]
+            for cell in cells:
+                self._cells[cell].add(key)
+        return [shape, shape._version, None, rect, cells]
+
+    def _remove(self, key, entry):
+        cells = entry[4]
+        if cells is None:
+            self._large.discard(key)
+            return
+        for cell in cells:
+            keys = self._cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self._cells[cell]
@@ -24,6 +24,7 @@ from .qt import newAction
 from .qt import addActions
 from .qt import labelValidator
 from .qt import struct
+from .qt import img_arr_to_qt
 from .qt import distance
 from .qt import distancetoline
 from .qt import fmtShortcut
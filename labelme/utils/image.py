@@ -8,6 +8,8 @@ import numpy as np
 import PIL.ExifTags
 import PIL.Image
 import PIL.ImageOps
+from qtpy import QtCore
+from qtpy import QtGui
 
 
 def img_data_to_pil(img_data):
@@ -59,7 +61,16 @@ def img_data_to_png_data(img_data):
             return f.read()
 
 
-def img_qt_to_arr(img_qt):
+def img_qt_to_arr(img_qt, max_size=None):
+    # downscaling before the conversion avoids copying the full image
+    if max_size is not None and max(img_qt.width(), img_qt.height()) > max_size:
+        img_qt = img_qt.scaled(
+            max_size,
+            max_size,
+            QtCore.Qt.KeepAspectRatio,
+            QtCore.Qt.SmoothTransformation,
+        )
+    img_qt = img_qt.convertToFormat(QtGui.QImage.Format_RGBA8888)
     w, h, d = img_qt.size().width(), img_qt.size().height(), img_qt.depth()
     bytes_ = img_qt.bits().asstring(w * h * d // 8)
     img_arr = np.frombuffer(bytes_, dtype=np.uint8).reshape((h, w, d // 8))
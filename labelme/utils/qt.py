@@ -75,6 +75,23 @@ class struct(object):
         self.__dict__.update(kwargs)
 
 
+def img_arr_to_qt(img_arr):
+    """Convert an uint8 array of gray, RGB or RGBA to QImage without encoding."""
+    img_arr = np.ascontiguousarray(img_arr, dtype=np.uint8)
+    if img_arr.ndim == 2:
+        format = QtGui.QImage.Format_Grayscale8
+    elif img_arr.shape[2] == 3:
+        format = QtGui.QImage.Format_RGB888
+    elif img_arr.shape[2] == 4:
+        format = QtGui.QImage.Format_RGBA8888
+    else:
+        raise ValueError("Unsupported image shape: {}".format(img_arr.shape))
+    height, width = img_arr.shape[:2]
+    img_qt = QtGui.QImage(img_arr.data, width, height, img_arr.strides[0], format)
+    # copy as the QImage does not own the buffer of the array
+    return img_qt.copy()
+
+
 def distance(p):
     return sqrt(p.x() * p.x() + p.y() * p.y())
 
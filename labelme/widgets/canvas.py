@@ -1,3 +1,5 @@
+import threading
+
 import imgviz
 from qtpy import QtCore
 from qtpy import QtGui
@@ -6,8 +8,10 @@ from qtpy import QtWidgets
 import labelme.ai
 import labelme.utils
 from labelme import QT5
+from labelme.ai_predictor import AiPredictor
 from labelme.logger import logger
 from labelme.shape import Shape
+from labelme.shape_index import ShapeIndex
 
 # TODO(unknown):
 # - [maybe] Find optimal epsilon value.
@@ -59,6 +63,10 @@ class Canvas(QtWidgets.QWidget):
                 "ai_mask": False,
             },
         )
+        self._ai_embedding_cache = kwargs.pop("ai_embedding_cache", None)
+        self._ai_session_config = kwargs.pop("ai_session_config", None)
+        self._ai_max_image_size = kwargs.pop("ai_max_image_size", None)
+        self._ai_models = kwargs.pop("ai_models", labelme.ai.MODELS)
         super(Canvas, self).__init__(*args, **kwargs)
         # Initialise local state.
         self.mode = self.EDIT
@@ -101,7 +109,22 @@ class Canvas(QtWidgets.QWidget):
         self.setFocusPolicy(QtCore.Qt.WheelFocus)
         self.groupIdColorObjSort = False
 
+        # shapes near the cursor are looked up in the index for hit-testing
+        self._shapeIndex = ShapeIndex()
+        # painted with less detail while zooming or panning, and with full
+        # detail again once the view stays still
+        self._interactionTimer = QtCore.QTimer(self)
+        self._interactionTimer.setSingleShot(True)
+        self._interactionTimer.setInterval(200)
+        self._interactionTimer.timeout.connect(self.update)
+        self._paintedView = None  # (pixmap key, scale) of the last paint
+
         self._ai_model = None
+        # prediction for the shape being drawn, which is made in background
+        self._aiPredictor = AiPredictor(self)
+        self._aiPredictor.predicted.connect(self._onAiPredicted)
+        self._aiRequestKey = None
+        self._aiPrediction = None  # (key, kwargs of Shape.setShapeRefined)
 
     def fillDrawing(self):
         return self._fill_drawing
@@ -129,25 +152,52 @@ class Canvas(QtWidgets.QWidget):
         self._createMode = value
 
     def initializeAiModel(self, name):
-        if name not in [model.name for model in labelme.ai.MODELS]:
+        if name not in [model.name for model in self._ai_models]:
             raise ValueError("Unsupported ai model: %s" % name)
-        model = [model for model in labelme.ai.MODELS if model.name == name][0]
+        model = [model for model in self._ai_models if model.name == name][0]
 
         if self._ai_model is not None and self._ai_model.name == model.name:
             logger.debug("AI model is already initialized: %r" % model.name)
         else:
             logger.debug("Initializing AI model: %r" % model.name)
-            self._ai_model = model()
+            if self._ai_model is not None:
+                # stops its embedding worker, which keeps it alive otherwise
+                self._ai_model.close()
+            self._ai_model = model(
+                embedding_cache=self._ai_embedding_cache,
+                session_config=self._ai_session_config,
+                max_image_size=self._ai_max_image_size,
+            )
+            # download and load the model in background
+            threading.Thread(
+                target=_warm_up_ai_model, args=(self._ai_model,), daemon=True
+            ).start()
 
         if self.pixmap is None:
             logger.warning("Pixmap is not set yet")
             return
 
+        self._setAiModelImage()
+
+    def _setAiModelImage(self):
+        image = self.pixmap.toImage()
         self._ai_model.set_image(
-            image=labelme.utils.img_qt_to_arr(self.pixmap.toImage())
+            image=labelme.utils.img_qt_to_arr(image, max_size=self._ai_max_image_size),
+            original_shape=(image.height(), image.width()),
+        )
+
+    def prefetchAiImage(self, image):
+        """Compute the image embedding of QImage in background, if AI is used."""
+        model = self._ai_model
+        if model is None:
+            return
+        model.prefetch_image(
+            image=labelme.utils.img_qt_to_arr(image, max_size=self._ai_max_image_size)
         )
 
     def storeShapes(self):
+        # stored after every change of the shapes, with which they are indexed
+        self._shapeIndex.update(self.shapes)
         shapesBackup = []
         for shape in self.shapes:
             shapesBackup.append(shape.copy())
@@ -176,6 +226,7 @@ class Canvas(QtWidgets.QWidget):
         # push this right back onto the stack.
         shapesBackup = self.shapesBackups.pop()
         self.shapes = shapesBackup
+        self._shapeIndex.update(self.shapes)
         self.selectedShapes = []
         for shape in self.shapes:
             shape.selected = False
@@ -194,6 +245,14 @@ class Canvas(QtWidgets.QWidget):
     def isVisible(self, shape):
         return self.visible.get(shape, True)
 
+    def _shapesAt(self, point, margin=0):
+        """Return visible shapes around point, from the topmost one."""
+        return [
+            shape
+            for shape in self._shapeIndex.query(point.x(), point.y(), margin=margin)
+            if self.isVisible(shape)
+        ]
+
     def drawing(self):
         return self.mode == self.CREATE
 
@@ -326,7 +385,7 @@ class Canvas(QtWidgets.QWidget):
         # - Highlight vertex
         # Update shape/vertex fill and tooltip value accordingly.
         self.setToolTip(self.tr("Image"))
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
+        for shape in self._shapesAt(pos, margin=self.epsilon / self.scale):
             # Look for a nearby vertex to highlight. If that fails,
             # check if we happen to be inside a shape.
             index = shape.nearestVertex(pos, self.epsilon / self.scale)
@@ -382,6 +441,7 @@ class Canvas(QtWidgets.QWidget):
         if shape is None or index is None or point is None:
             return
         shape.insertPoint(index, point)
+        self._shapeIndex.refresh([shape])
         shape.highlightVertex(index, shape.MOVE_VERTEX)
         self.hShape = shape
         self.hVertex = index
@@ -394,6 +454,7 @@ class Canvas(QtWidgets.QWidget):
         if shape is None or index is None:
             return
         shape.removePoint(index)
+        self._shapeIndex.refresh([shape])
         shape.highlightClear()
         self.hShape = shape
         self.prevhVertex = None
@@ -430,7 +491,7 @@ class Canvas(QtWidgets.QWidget):
                             self.line.points[1],
                             label=self.line.point_labels[1],
                         )
-                        self.line.points[0] = self.current.points[-1]
+                        self.line[0] = self.current[-1]
                         self.line.point_labels[0] = self.current.point_labels[-1]
                         if ev.modifiers() & QtCore.Qt.ControlModifier:
                             self.finalise()
@@ -525,8 +586,9 @@ class Canvas(QtWidgets.QWidget):
             for i, shape in enumerate(self.selectedShapesCopy):
                 self.selectedShapes[i].points = shape.points
         self.selectedShapesCopy = []
-        self.repaint()
+        # the shapes are indexed for painting when stored
         self.storeShapes()
+        self.repaint()
         return True
 
     def hideBackroundShapes(self, value):
@@ -563,8 +625,8 @@ class Canvas(QtWidgets.QWidget):
             index, shape = self.hVertex, self.hShape
             shape.highlightVertex(index, shape.MOVE_VERTEX)
         else:
-            for shape in reversed(self.shapes):
-                if self.isVisible(shape) and shape.containsPoint(point):
+            for shape in self._shapesAt(point):
+                if shape.containsPoint(point):
                     self.setHiding()
                     if shape not in self.selectedShapes:
                         if multiple_selection_mode:
@@ -606,6 +668,7 @@ class Canvas(QtWidgets.QWidget):
         if self.outOfPixmap(pos):
             pos = self.intersectionPoint(point, pos)
         shape.moveVertexBy(index, pos - point)
+        self._shapeIndex.refresh([shape])
 
     def boundedMoveShapes(self, shapes, pos):
         if self.outOfPixmap(pos):
@@ -628,6 +691,7 @@ class Canvas(QtWidgets.QWidget):
         if dp:
             for shape in shapes:
                 shape.moveBy(dp)
+            self._shapeIndex.refresh(shapes)
             self.prevPoint = pos
             return True
         return False
@@ -679,16 +743,30 @@ class Canvas(QtWidgets.QWidget):
         if not self.pixmap:
             return super(Canvas, self).paintEvent(event)
 
+        if self._paintedView is not None and self._paintedView[1] != self.scale:
+            self._startInteraction()
+        self._paintedView = (self.pixmap.cacheKey(), self.scale)
+        simplified = self._interactionTimer.isActive()
+
         p = self._painter
         p.begin(self)
-        p.setRenderHint(QtGui.QPainter.Antialiasing)
-        p.setRenderHint(QtGui.QPainter.HighQualityAntialiasing)
-        p.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+        if not simplified:
+            p.setRenderHint(QtGui.QPainter.Antialiasing)
+            p.setRenderHint(QtGui.QPainter.HighQualityAntialiasing)
+            p.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
 
         p.scale(self.scale, self.scale)
         p.translate(self.offsetToCenter())
 
-        p.drawPixmap(0, 0, self.pixmap)
+        # only the exposed part of the image, with a margin of a pixel for
+        # the smooth transform
+        exposed = p.transform().inverted()[0].mapRect(QtCore.QRectF(event.rect()))
+        source = (
+            exposed.toAlignedRect()
+            .adjusted(-1, -1, 1, 1)
+            .intersected(self.pixmap.rect())
+        )
+        p.drawPixmap(source.topLeft(), self.pixmap, source)
 
         # draw crosshair
         if (
@@ -712,10 +790,17 @@ class Canvas(QtWidgets.QWidget):
             )
 
         Shape.scale = self.scale
-        for shape in self.shapes:
+        for shape in self._shapeIndex.query_rect(
+            exposed.left(),
+            exposed.top(),
+            exposed.right(),
+            exposed.bottom(),
+            # vertices and lines are drawn out of the bounding box
+            margin=(2 * Shape.point_size + 2) / self.scale,
+        ):
             if (shape.selected or not self._hideBackround) and self.isVisible(shape):
                 shape.fill = shape.selected or shape == self.hShape
-                shape.paint(p)
+                shape.paint(p, simplified=simplified)
         if self.current:
             self.current.paint(p)
             assert len(self.line.points) == len(self.line.point_labels)
@@ -740,47 +825,81 @@ class Canvas(QtWidgets.QWidget):
             drawing_shape.addPoint(self.line[1])
             drawing_shape.fill = True
             drawing_shape.paint(p)
-        elif self.createMode == "ai_polygon" and self.current is not None:
+        elif (
+            self.createMode in ["ai_polygon", "ai_mask"]
+            and self.current is not None
+            and self._ai_model is not None
+        ):
             drawing_shape = self.current.copy()
             drawing_shape.addPoint(
                 point=self.line.points[1],
                 label=self.line.point_labels[1],
             )
-            points = self._ai_model.predict_polygon_from_points(
-                points=[[point.x(), point.y()] for point in drawing_shape.points],
-                point_labels=drawing_shape.point_labels,
-            )
-            if len(points) > 2:
-                drawing_shape.setShapeRefined(
-                    shape_type="polygon",
-                    points=[QtCore.QPointF(point[0], point[1]) for point in points],
-                    point_labels=[1] * len(points),
+            # draw the last prediction, which may lag behind the cursor
+            self._requestAiPrediction(drawing_shape)
+            shape_kwargs = self._getAiPrediction()
+            if shape_kwargs is not None and (
+                shape_kwargs["shape_type"] == "mask" or len(shape_kwargs["points"]) > 2
+            ):
+                drawing_shape.setShapeRefined(**shape_kwargs)
+                drawing_shape.fill = (
+                    shape_kwargs["shape_type"] == "polygon" and self.fillDrawing()
                 )
-                drawing_shape.fill = self.fillDrawing()
                 drawing_shape.selected = True
                 drawing_shape.paint(p)
-        elif self.createMode == "ai_mask" and self.current is not None:
-            drawing_shape = self.current.copy()
-            drawing_shape.addPoint(
-                point=self.line.points[1],
-                label=self.line.point_labels[1],
-            )
-            mask = self._ai_model.predict_mask_from_points(
-                points=[[point.x(), point.y()] for point in drawing_shape.points],
-                point_labels=drawing_shape.point_labels,
-            )
-            y1, x1, y2, x2 = imgviz.instances.masks_to_bboxes([mask])[0].astype(int)
-            drawing_shape.setShapeRefined(
-                shape_type="mask",
-                points=[QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2)],
-                point_labels=[1, 1],
-                mask=mask[y1 : y2 + 1, x1 : x2 + 1],
-            )
-            drawing_shape.selected = True
-            drawing_shape.paint(p)
 
         p.end()
 
+    def moveEvent(self, ev):
+        # moved in the scroll area by panning
+        self._startInteraction()
+        super(Canvas, self).moveEvent(ev)
+
+    def _startInteraction(self):
+        # not for an image loaded since the last paint, which is a new view
+        if (
+            self.pixmap
+            and self._paintedView is not None
+            and self._paintedView[0] == self.pixmap.cacheKey()
+        ):
+            self._interactionTimer.start()
+
+    def _getAiRequestKey(self, shape):
+        return (
+            self.current,
+            self.createMode,
+            self.pixmap.cacheKey(),
+            tuple((point.x(), point.y()) for point in shape.points),
+            tuple(shape.point_labels),
+        )
+
+    def _requestAiPrediction(self, shape):
+        key = self._getAiRequestKey(shape)
+        if key == self._aiRequestKey:
+            return
+        self._aiRequestKey = key
+        self._aiPredictor.request(
+            key,
+            _predict_shape,
+            model=self._ai_model,
+            create_mode=self.createMode,
+            points=[[point.x(), point.y()] for point in shape.points],
+            point_labels=list(shape.point_labels),
+        )
+
+    def _onAiPredicted(self, key, shape_kwargs):
+        self._aiPrediction = (key, shape_kwargs)
+        self.update()
+
+    def _getAiPrediction(self):
+        """Return the last prediction for the shape being drawn, or None."""
+        if self._aiPrediction is None:
+            return None
+        key, shape_kwargs = self._aiPrediction
+        if key[:3] != self._getAiRequestKey(self.current)[:3]:
+            return None  # for another shape, mode or image
+        return shape_kwargs
+
     def transformPos(self, point):
         """Convert from widget-logical coordinates to painter-logical ones."""
         return point / self.scale - self.offsetToCenter()
@@ -800,32 +919,22 @@ class Canvas(QtWidgets.QWidget):
 
     def finalise(self):
         assert self.current
-        if self.createMode == "ai_polygon":
-            # convert points to polygon by an AI model
+        if self.createMode in ["ai_polygon", "ai_mask"]:
+            # convert points to polygon or mask by an AI model
             assert self.current.shape_type == "points"
-            points = self._ai_model.predict_polygon_from_points(
-                points=[[point.x(), point.y()] for point in self.current.points],
-                point_labels=self.current.point_labels,
-            )
-            self.current.setShapeRefined(
-                points=[QtCore.QPointF(point[0], point[1]) for point in points],
-                point_labels=[1] * len(points),
-                shape_type="polygon",
-            )
-        elif self.createMode == "ai_mask":
-            # convert points to mask by an AI model
-            assert self.current.shape_type == "points"
-            mask = self._ai_model.predict_mask_from_points(
-                points=[[point.x(), point.y()] for point in self.current.points],
-                point_labels=self.current.point_labels,
-            )
-            y1, x1, y2, x2 = imgviz.instances.masks_to_bboxes([mask])[0].astype(int)
-            self.current.setShapeRefined(
-                shape_type="mask",
-                points=[QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2)],
-                point_labels=[1, 1],
-                mask=mask[y1 : y2 + 1, x1 : x2 + 1],
-            )
+            key = self._getAiRequestKey(self.current)
+            if self._aiPrediction is not None and self._aiPrediction[0] == key:
+                shape_kwargs = self._aiPrediction[1]
+            else:
+                shape_kwargs = _predict_shape(
+                    model=self._ai_model,
+                    create_mode=self.createMode,
+                    points=[[point.x(), point.y()] for point in self.current.points],
+                    point_labels=self.current.point_labels,
+                )
+            self.current.setShapeRefined(**shape_kwargs)
+            self._aiPredictor.cancel()
+            self._aiRequestKey = self._aiPrediction = None
         self.current.close()
 
         self.shapes.append(self.current)
@@ -989,6 +1098,7 @@ class Canvas(QtWidgets.QWidget):
     def undoLastLine(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self._shapeIndex.update(self.shapes)
         self.current.setOpen()
         self.current.restoreShapeRaw()
         if self.createMode in ["polygon", "linestrip"]:
@@ -1013,11 +1123,10 @@ class Canvas(QtWidgets.QWidget):
     def loadPixmap(self, pixmap, clear_shapes=True):
         self.pixmap = pixmap
         if self._ai_model:
-            self._ai_model.set_image(
-                image=labelme.utils.img_qt_to_arr(self.pixmap.toImage())
-            )
+            self._setAiModelImage()
         if clear_shapes:
             self.shapes = []
+            self._shapeIndex.update(self.shapes)
         self.update()
 
     def loadShapes(self, shapes, replace=True):
@@ -1048,4 +1157,34 @@ class Canvas(QtWidgets.QWidget):
         self.restoreCursor()
         self.pixmap = None
         self.shapesBackups = []
+        self._paintedView = None
+        self._interactionTimer.stop()
         self.update()
+
+
+def _predict_shape(model, create_mode, points, point_labels):
+    """Return kwargs of Shape.setShapeRefined predicted by an AI model."""
+    if create_mode == "ai_polygon":
+        points = model.predict_polygon_from_points(
+            points=points, point_labels=point_labels
+        )
+        return dict(
+            shape_type="polygon",
+            points=[QtCore.QPointF(point[0], point[1]) for point in points],
+            point_labels=[1] * len(points),
+        )
+    mask = model.predict_mask_from_points(points=points, point_labels=point_labels)
+    y1, x1, y2, x2 = imgviz.instances.masks_to_bboxes([mask])[0].astype(int)
+    return dict(
+        shape_type="mask",
+        points=[QtCore.QPointF(x1, y1), QtCore.QPointF(x2, y2)],
+        point_labels=[1, 1],
+        mask=mask[y1 : y2 + 1, x1 : x2 + 1],
+    )
+
+
+def _warm_up_ai_model(model):
+    try:
+        model.warm_up()
+    except Exception as e:
+        logger.error("Failed to load AI model {!r}: {}".format(model.name, e))
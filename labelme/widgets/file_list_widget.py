@@ -0,0 +1,141 @@
+from qtpy import QtCore
+from qtpy import QtWidgets
+from qtpy.QtCore import Qt
+
+
+class FileListModel(QtCore.QAbstractListModel):
+    """List model of filenames with O(1) lookup of the row of a filename.
+
+    The checked state of a file, which tells if it has a label file, is
+    either given when it is added or computed by `is_checked(filename)` when
+    the view asks for it for the first time.
+    """
+
+    def __init__(self, is_checked=None, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self._filenames = []
+        self._rows = {}  # key=filename, value=row
+        self._checked = {}  # key=filename, value=bool
+        self._is_checked = is_checked
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._filenames)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._filenames):
+            return None
+        filename = self._filenames[index.row()]
+        if role in [Qt.DisplayRole, Qt.ToolTipRole]:
+            return filename
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if self.isChecked(filename) else Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def filenames(self):
+        return list(self._filenames)
+
+    def filename(self, row):
+        return self._filenames[row]
+
+    def indexOf(self, filename):
+        return self._rows.get(filename, -1)
+
+    def addFiles(self, filenames, checked=None):
+        """Append files, skipping the ones already in the list."""
+        if checked is None:
+            checked = [None] * len(filenames)
+        new_files = []
+        for filename, is_checked in zip(filenames, checked):
+            if filename in self._rows:
+                continue
+            self._rows[filename] = len(self._filenames) + len(new_files)
+            if is_checked is not None:
+                self._checked[filename] = is_checked
+            new_files.append(filename)
+        if not new_files:
+            return
+        row = len(self._filenames)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row + len(new_files) - 1)
+        self._filenames.extend(new_files)
+        self.endInsertRows()
+
+    def isChecked(self, filename):
+        if filename not in self._checked:
+            self._checked[filename] = bool(
+                self._is_checked is not None and self._is_checked(filename)
+            )
+        return self._checked[filename]
+
+    def setChecked(self, filename, checked):
+        row = self.indexOf(filename)
+        if row < 0:
+            return
+        self._checked[filename] = checked
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+
+    def clear(self):
+        self.beginResetModel()
+        self._filenames = []
+        self._rows = {}
+        self._checked = {}
+        self.endResetModel()
+
+
+class FileListWidget(QtWidgets.QListView):
+    """View of FileListModel, which only lays out and paints visible rows."""
+
+    itemSelectionChanged = QtCore.Signal()
+
+    def __init__(self, is_checked=None):
+        super(FileListWidget, self).__init__()
+        self.setModel(FileListModel(is_checked=is_checked, parent=self))
+        self.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QtWidgets.QListView.Batched)
+        self.selectionModel().selectionChanged.connect(
+            lambda selected, deselected: self.itemSelectionChanged.emit()
+        )
+
+    def __len__(self):
+        return self.model().rowCount()
+
+    def count(self):
+        return len(self)
+
+    def filenames(self):
+        return self.model().filenames()
+
+    def filename(self, row):
+        return self.model().filename(row)
+
+    def indexOf(self, filename):
+        return self.model().indexOf(filename)
+
+    def addFiles(self, filenames, checked=None):
+        self.model().addFiles(filenames, checked=checked)
+
+    def isChecked(self, filename):
+        return self.model().isChecked(filename)
+
+    def setChecked(self, filename, checked):
+        self.model().setChecked(filename, checked)
+
+    def selectedFilenames(self):
+        return [self.filename(index.row()) for index in self.selectedIndexes()]
+
+    def currentRow(self):
+        return self.currentIndex().row()
+
+    def setCurrentRow(self, row):
+        self.setCurrentIndex(self.model().index(row))
+
+    def clear(self):
+        self.model().clear()
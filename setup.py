@@ -151,6 +151,8 @@ def main():
                 "labelme_json_to_dataset=labelme.cli.json_to_dataset:main",
                 "labelme_export_json=labelme.cli.export_json:main",
                 "labelme_on_docker=labelme.cli.on_docker:main",
+                "labelme_auto_annotate=labelme.cli.auto_annotate:main",
+                "labelme_precompute_embeddings=labelme.cli.precompute_embeddings:main",
             ],
         },
     )
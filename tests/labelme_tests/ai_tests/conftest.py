@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+
+class _EncoderSession:
+    def run(self, output_names, input_feed):
+        return [np.zeros((1, 256, 64, 64), dtype=np.float32)]
+
+
+@pytest.fixture
+def make_model():
+    """Return a function creating a model with fake sessions.
+
+    The encoder computes zeros as the image embedding, and the decoder is
+    given, which is None if unused.
+    """
+    models = []
+
+    def make_model(model_class, decoder_session=None, **kwargs):
+        model = model_class(
+            encoder_path="encoder.onnx", decoder_path="decoder.onnx", **kwargs
+        )
+        model._sessions = (_EncoderSession(), decoder_session)
+        models.append(model)
+        return model
+
+    yield make_model
+    for model in models:
+        model.close()
@@ -0,0 +1,179 @@
+import gc
+import threading
+import weakref
+
+import numpy as np
+
+from labelme.ai import EmbeddingCache
+from labelme.ai import efficient_sam
+from labelme.ai.efficient_sam import EfficientSam
+
+
+class _Input:
+    def __init__(self, name, shape):
+        self.name = name
+        self.shape = shape
+
+
+class _DecoderSession:
+    def __init__(self):
+        self.calls = []
+
+    def get_inputs(self):
+        return [
+            _Input("image_embeddings", [1, 256, 64, 64]),
+            _Input("batched_point_coords", [1, "num_queries", "num_points", 2]),
+            _Input("batched_point_labels", [1, "num_queries", "num_points"]),
+            _Input("orig_im_size", [2]),
+        ]
+
+    def run(self, output_names, input_feed):
+        coords = input_feed["batched_point_coords"]
+        labels = input_feed["batched_point_labels"]
+        self.calls.append((coords.copy(), labels.copy()))
+        height, width = input_feed["orig_im_size"]
+        masks = np.zeros((1, coords.shape[1], 3, height, width), dtype=np.float32)
+        for i in range(coords.shape[1]):
+            x, y = coords[0, i, 0].astype(int)
+            masks[0, i, 0, y : y + 5, x : x + 5] = 1
+        return masks, None, None
+
+
+def test_EfficientSam_predict_masks_from_prompts(make_model):
+    decoder_session = _DecoderSession()
+    model = make_model(EfficientSam, decoder_session=decoder_session)
+    model.set_image(np.zeros((20, 20, 3), dtype=np.uint8))
+
+    prompts = [
+        ([[2, 2]], [1]),
+        ([[10, 10], [15, 15]], [2, 3]),
+        ([[2.1, 1.9]], [1]),  # same as the first
+    ]
+    masks = model.predict_masks_from_prompts(prompts)
+    assert len(decoder_session.calls) == 1
+    coords, labels = decoder_session.calls[0]
+    assert coords.shape == (1, 2, 2, 2)
+    np.testing.assert_array_equal(labels, [[[1, -1], [2, 3]]])
+
+    assert len(masks) == 3
+    assert masks[0][2:7, 2:7].all() and masks[0].sum() == 25
+    assert masks[1][10:15, 10:15].all() and masks[1].sum() == 25
+    assert masks[2] is masks[0]
+
+    # cached
+    mask = model.predict_mask_from_points(
+        points=[[10, 10], [15, 15]], point_labels=[2, 3]
+    )
+    assert mask is masks[1]
+    assert len(decoder_session.calls) == 1
+
+
+def test_compute_masks_from_prompts_chunks():
+    decoder_session = _DecoderSession()
+    prompts = [([[i, i]], [1]) for i in range(10)]
+    masks = efficient_sam._compute_masks_from_prompts(
+        decoder_session=decoder_session,
+        image=np.zeros((20, 20, 3), dtype=np.uint8),
+        image_embedding=np.zeros((1, 256, 64, 64), dtype=np.float32),
+        prompts=prompts,
+    )
+    # decoded in chunks of a fixed number of queries
+    assert [coords.shape[1] for coords, _ in decoder_session.calls] == [4, 4, 2]
+    assert len(masks) == 10
+    for i, mask in enumerate(masks):
+        assert mask[i : i + 5, i : i + 5].all() and mask.sum() == 25
+
+
+def test_EfficientSam_downscaled_image(make_model):
+    decoder_session = _DecoderSession()
+    model = make_model(EfficientSam, decoder_session=decoder_session)
+    # given already downscaled
+    model.set_image(np.zeros((20, 20, 3), dtype=np.uint8), original_shape=(40, 40))
+
+    mask = model.predict_mask_from_points(points=[[5, 5]], point_labels=[1])
+    coords, _ = decoder_session.calls[0]
+    np.testing.assert_allclose(coords[0, 0, 0], [2.25, 2.25])
+    # the mask of 5x5 pixels at (2, 2) in the downscaled image
+    assert mask.shape == (40, 40)
+    assert mask[4:14, 4:14].all() and mask.sum() == 100
+
+    polygon = model.predict_polygon_from_points(points=[[5, 5]], point_labels=[1])
+    assert len(decoder_session.calls) == 1
+    np.testing.assert_allclose(polygon.min(axis=0), [4.5, 4.5], atol=1)
+    np.testing.assert_allclose(polygon.max(axis=0), [13.5, 13.5], atol=1)
+
+
+def test_EfficientSam_embedding_worker():
+    model = EfficientSam(encoder_path="encoder.onnx", decoder_path="decoder.onnx")
+
+    started = threading.Event()
+    release = threading.Event()
+    encoded = []
+
+    def encode_image(image):
+        started.set()
+        release.wait()
+        encoded.append(int(image[0, 0, 0]))
+        return np.full((1, 256, 64, 64), image[0, 0, 0], dtype=np.float32)
+
+    model._encode_image = encode_image
+
+    images = [np.full((20, 20, 3), i, dtype=np.uint8) for i in range(5)]
+    model.set_image(images[1])
+    started.wait()
+    # superseded while the embedding of images[1] is computed
+    model.set_image(images[2])
+    model.prefetch_image(images[4])
+    model.set_image(images[3])
+    release.set()
+
+    assert model._get_image_embedding()[0, 0, 0, 0] == 3
+    with model._condition:
+        while model._computing_key is not None or model._prefetch_requests:
+            model._condition.wait()
+    assert encoded == [1, 3, 4]
+
+    # computed in prefetch
+    model.set_image(images[4])
+    assert model._get_image_embedding()[0, 0, 0, 0] == 4
+    assert encoded == [1, 3, 4]
+
+
+def test_EfficientSam_close():
+    model = EfficientSam(encoder_path="encoder.onnx", decoder_path="decoder.onnx")
+    model._encode_image = lambda image: np.zeros((1, 8, 4, 4), dtype=np.float32)
+    model.set_image(np.zeros((20, 20, 3), dtype=np.uint8))
+    assert model._get_image_embedding() is not None
+    worker = model._worker
+    assert worker.is_alive()
+
+    model_ref = weakref.ref(model)
+    model.close()
+    assert not worker.is_alive()
+    # not computed anymore
+    model.set_image(np.ones((20, 20, 3), dtype=np.uint8))
+    assert model._worker is None
+    assert model._get_image_embedding() is None
+
+    del model
+    gc.collect()
+    assert model_ref() is None
+
+
+def test_EfficientSam_embedding_cache(tmp_path):
+    embedding_cache = EmbeddingCache(cache_dir=str(tmp_path))
+    model = EfficientSam(
+        encoder_path="encoder.onnx",
+        decoder_path="decoder.onnx",
+        embedding_cache=embedding_cache,
+    )
+    model._encode_image = lambda image: np.zeros((1, 8, 4, 4), dtype=np.float32)
+
+    for i in range(3):
+        model.set_image(np.full((20, 20, 3), i, dtype=np.uint8))
+        assert model._get_image_embedding() is not None
+        # stored once waited for
+        assert (
+            embedding_cache.get(model._embedding_cache_name, model._image_key)
+            is not None
+        )
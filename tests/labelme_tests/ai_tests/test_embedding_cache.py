@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from labelme.ai import EmbeddingCache
+from labelme.ai.embedding_cache import compute_image_key
+
+
+def test_compute_image_key():
+    image = np.zeros((4, 6, 3), dtype=np.uint8)
+    assert compute_image_key(image) == compute_image_key(image.copy())
+    assert compute_image_key(image) != compute_image_key(image.reshape(6, 4, 3))
+    image2 = image.copy()
+    image2[0, 0, 0] = 1
+    assert compute_image_key(image) != compute_image_key(image2)
+    assert compute_image_key(image2[:, ::2]) == compute_image_key(image2[:, ::2].copy())
+    image_readonly = np.frombuffer(image2.tobytes(), dtype=np.uint8)
+    assert compute_image_key(image_readonly.reshape(image2.shape)) == (
+        compute_image_key(image2)
+    )
+
+
+def test_EmbeddingCache():
+    tmp_dir = tempfile.mkdtemp()
+    embedding = np.random.uniform(size=(1, 8, 16, 16)).astype(np.float32)
+    cache = EmbeddingCache(cache_dir=tmp_dir, max_size=embedding.nbytes * 2.5)
+
+    assert cache.get("model (a)", "key0") is None
+    cache.put("model (a)", "key0", embedding)
+    embedding_cached = cache.get("model (a)", "key0")
+    assert isinstance(embedding_cached, np.memmap)
+    np.testing.assert_array_equal(embedding_cached, embedding)
+    assert cache.get("model (b)", "key0") is None
+
+    # the least recently used is evicted
+    cache.put("model (a)", "key1", embedding)
+    os.utime(cache._get_filename("model (a)", "key0"), (0, 0))
+    cache.put("model (b)", "key0", embedding)
+    assert cache.get("model (a)", "key0") is None
+    assert cache.get("model (a)", "key1") is not None
+    assert cache.get("model (b)", "key0") is not None
+
+    cache.invalidate("model (a)")
+    assert cache.get("model (a)", "key1") is None
+    assert cache.get("model (b)", "key0") is not None
+    shutil.rmtree(tmp_dir)
+
+
+def test_EmbeddingCache_scan(tmp_path, monkeypatch):
+    embedding = np.zeros((1, 8, 16, 16), dtype=np.float32)
+    cache = EmbeddingCache(cache_dir=str(tmp_path), max_size=embedding.nbytes * 10.5)
+
+    scanned = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, "_scan", lambda: scanned.append(1) or scan())
+
+    # the files are scanned once and then only when the cache is full
+    for i in range(10):
+        cache.put("model", "key{}".format(i), embedding)
+    cache.put("model", "key0", embedding)
+    assert len(scanned) == 1
+    cache.put("model", "key10", embedding)
+    assert len(scanned) == 2
+    assert len(os.listdir(str(tmp_path / "model"))) == 9
+    # some more are evicted not to scan them again on the next put
+    cache.put("model", "key11", embedding)
+    assert len(scanned) == 2
+    assert len(os.listdir(str(tmp_path / "model"))) == 10
+
+    cache.invalidate("model")
+    cache.put("model", "key0", embedding)
+    assert len(scanned) == 3
+    assert cache._size == os.path.getsize(cache._get_filename("model", "key0"))
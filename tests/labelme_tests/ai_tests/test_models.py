@@ -0,0 +1,57 @@
+import labelme.ai
+
+
+def test_get_models():
+    models = labelme.ai.get_models(
+        [
+            dict(
+                name="EfficientSam (accuracy)",
+                encoder_path="encoder.onnx",
+                decoder_path="decoder.onnx",
+            ),
+            dict(
+                name="MySam",
+                type="SegmentAnythingModel",
+                encoder_path="my_encoder.onnx",
+                decoder_path="my_decoder.onnx",
+            ),
+        ]
+    )
+    model_names = [model.name for model in labelme.ai.MODELS]
+    assert [model.name for model in models] == model_names + ["MySam"]
+
+    model = models[model_names.index("EfficientSam (accuracy)")]
+    assert issubclass(model, labelme.ai.EfficientSamVitS)
+    assert model.encoder_path == "encoder.onnx"
+    assert issubclass(models[-1], labelme.ai.SegmentAnythingModel)
+
+    # the files are not loaded until used
+    model = models[-1]()
+    assert model._sessions is None
+
+
+def test_embedding_cache_name(tmp_path):
+    encoder_path = tmp_path / "encoder.onnx"
+    encoder_path.write_bytes(b"encoder")
+
+    def get_name(path):
+        return labelme.ai.SegmentAnythingModel(
+            encoder_path=str(path), decoder_path="decoder.onnx"
+        )._embedding_cache_name
+
+    name = get_name(encoder_path)
+    assert name.startswith("encoder.onnx.")
+    assert get_name(encoder_path) == name
+
+    # another encoder at the same path, or of the same name elsewhere
+    encoder_path.write_bytes(b"another encoder")
+    assert get_name(encoder_path) != name
+    other_path = tmp_path / "other" / "encoder.onnx"
+    other_path.parent.mkdir()
+    other_path.write_bytes(b"encoder")
+    assert get_name(other_path) not in (name, get_name(encoder_path))
+
+    # the downloaded ones are identified by their md5
+    assert labelme.ai.EfficientSamVitS()._embedding_cache_name.startswith(
+        labelme.ai.EfficientSamVitS.name + "."
+    )
@@ -0,0 +1,92 @@
+import imgviz
+import numpy as np
+import pytest
+
+from labelme.ai import segment_anything_model
+from labelme.ai.segment_anything_model import SegmentAnythingModel
+
+
+def test_SegmentAnythingModel_predict_cache(make_model, monkeypatch):
+    model = make_model(SegmentAnythingModel)
+    model.set_image(np.zeros((20, 20, 3), dtype=np.uint8))
+
+    calls = []
+
+    def compute_mask_from_points(points, point_labels, **kwargs):
+        calls.append(points)
+        mask = np.zeros((20, 20), dtype=bool)
+        mask[5:15, 5:15] = True
+        return mask
+
+    monkeypatch.setattr(
+        segment_anything_model, "_compute_mask_from_points", compute_mask_from_points
+    )
+
+    mask = model.predict_mask_from_points(points=[[10.2, 9.8]], point_labels=[1])
+    assert len(calls) == 1
+    np.testing.assert_array_equal(calls[0], [[10, 10]])
+    # same pixel
+    polygon = model.predict_polygon_from_points(points=[[9.9, 10.1]], point_labels=[1])
+    assert len(calls) == 1
+    assert polygon.shape[1] == 2
+    assert model.predict_mask_from_points(points=[[10, 10]], point_labels=[1]) is mask
+    # the cached arrays cannot be modified by the callers
+    with pytest.raises(ValueError):
+        mask[0, 0] = True
+    with pytest.raises(ValueError):
+        polygon[0] = 0
+    # another label
+    model.predict_mask_from_points(points=[[10, 10]], point_labels=[0])
+    assert len(calls) == 2
+    # another image
+    model.set_image(np.ones((20, 20, 3), dtype=np.uint8))
+    model.predict_mask_from_points(points=[[10, 10]], point_labels=[1])
+    assert len(calls) == 3
+
+
+def test_SegmentAnythingModel_predict_cache_size(make_model, monkeypatch):
+    model = make_model(SegmentAnythingModel)
+    model.set_image(np.zeros((4096, 4096, 3), dtype=np.uint8))
+
+    monkeypatch.setattr(
+        segment_anything_model,
+        "_compute_mask_from_points",
+        lambda **kwargs: np.zeros((4096, 4096), dtype=bool),
+    )
+
+    # the masks of 16MB are bounded by their size rather than their count
+    for i in range(8):
+        model.predict_mask_from_points(points=[[i, i]], point_labels=[1])
+    assert len(model._prediction_cache) == 4
+    assert list(model._prediction_cache)[-1][2] == ((7, 7),)
+
+    # not predicted without the embedding, which failed or was superseded
+    def encode_image(image):
+        raise RuntimeError("failed")
+
+    monkeypatch.setattr(model, "_encode_image", encode_image)
+    model.set_image(np.ones((20, 20, 3), dtype=np.uint8))
+    with pytest.raises(RuntimeError):
+        model.predict_mask_from_points(points=[[0, 0]], point_labels=[1])
+
+
+def test_compute_image_embedding_input_buffer():
+    class EncoderSession:
+        def run(self, output_names, input_feed):
+            return [input_feed["x"].copy()]
+
+    image = np.random.RandomState(0).randint(0, 256, (300, 400, 4), dtype=np.uint8)
+    x = imgviz.resize(image[:, :, :3], height=768, width=1024, backend="pillow")
+    x = (x - np.array([123.675, 116.28, 103.53], dtype=np.float32)) / np.array(
+        [58.395, 57.12, 57.375], dtype=np.float32
+    )
+    expected = np.pad(x, ((0, 256), (0, 0), (0, 0))).transpose(2, 0, 1)[None]
+
+    input_buffer = np.full((1, 3, 1024, 1024), np.nan, dtype=np.float32)
+    x = segment_anything_model._compute_image_embedding(
+        image_size=1024,
+        encoder_session=EncoderSession(),
+        image=image,
+        input_buffer=input_buffer,
+    )
+    np.testing.assert_array_equal(x, expected)
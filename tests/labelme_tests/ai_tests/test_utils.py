@@ -0,0 +1,103 @@
+import os
+import sys
+import types
+
+import numpy as np
+
+from labelme.ai import _utils
+from labelme.config import get_default_config
+
+
+def test_compute_polygon_from_mask():
+    mask = np.zeros((100, 200), dtype=bool)
+    mask[20:40, 50:120] = True
+    mask[60:70, 0:10] = True  # smaller one
+
+    polygon = _utils.compute_polygon_from_mask(mask)
+    assert polygon.shape[1] == 2
+    # the contour is between the mask and background pixels
+    np.testing.assert_allclose(polygon.min(axis=0), [49.5, 19.5])
+    np.testing.assert_allclose(polygon.max(axis=0), [119.5, 39.5])
+
+    mask[:] = False
+    mask[90:, 190:] = True  # at the corner
+    polygon = _utils.compute_polygon_from_mask(mask)
+    np.testing.assert_allclose(polygon.min(axis=0), [189.5, 89.5])
+    np.testing.assert_allclose(polygon.max(axis=0), [199, 99])
+
+    mask[:] = False
+    assert _utils.compute_polygon_from_mask(mask).shape == (0, 2)
+
+
+class _InferenceSession:
+    def __init__(self, path, sess_options=None, providers=None):
+        self.path = path
+        self.options = None if sess_options is None else dict(vars(sess_options))
+        self.providers = providers
+        if sess_options is not None and self.options.get("optimized_model_filepath"):
+            with open(sess_options.optimized_model_filepath, "w") as f:
+                f.write("optimized " + path)
+
+
+def _make_onnxruntime():
+    return types.SimpleNamespace(
+        __version__="0.0.0",
+        GraphOptimizationLevel=types.SimpleNamespace(
+            ORT_DISABLE_ALL=0,
+            ORT_ENABLE_BASIC=1,
+            ORT_ENABLE_EXTENDED=2,
+            ORT_ENABLE_ALL=3,
+        ),
+        SessionOptions=types.SimpleNamespace,
+        InferenceSession=_InferenceSession,
+    )
+
+
+def test_create_inference_session(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setitem(sys.modules, "onnxruntime", _make_onnxruntime())
+    model_path = str(tmp_path / "model.onnx")
+    with open(model_path, "w") as f:
+        f.write("model")
+    optimized_dir = tmp_path / "optimized"
+
+    session = _utils.create_inference_session(model_path)
+    assert session.path == model_path and session.options is None
+
+    config = get_default_config()["ai"]["session"]
+    config.update(
+        intra_op_num_threads=2,
+        providers=["CPUExecutionProvider"],
+        optimized_model_dir=str(optimized_dir),
+    )
+
+    # optimized and saved at the first time
+    session = _utils.create_inference_session(model_path, config=config)
+    assert session.path == model_path
+    assert session.providers == ["CPUExecutionProvider"]
+    assert session.options["intra_op_num_threads"] == 2
+    assert session.options["inter_op_num_threads"] == 0
+    assert session.options["graph_optimization_level"] == 3
+    assert session.options["enable_cpu_mem_arena"] is True
+    (optimized_path,) = [str(path) for path in optimized_dir.iterdir()]
+    assert optimized_path.endswith(".onnx")
+
+    # and loaded without optimizing at the next time
+    session = _utils.create_inference_session(model_path, config=config)
+    assert session.path == optimized_path
+    assert session.options["graph_optimization_level"] == 0
+
+    # optimized again for another model at the path
+    with open(model_path, "w") as f:
+        f.write("another model")
+    session = _utils.create_inference_session(model_path, config=config)
+    assert session.path == model_path
+    assert len(os.listdir(optimized_dir)) == 2
+
+    # not saved without optimization
+    config.update(graph_optimization_level="disable")
+    session = _utils.create_inference_session(model_path, config=config)
+    assert session.path == model_path
+    assert session.options["graph_optimization_level"] == 0
+    assert "optimized_model_filepath" not in session.options
+    assert len(os.listdir(optimized_dir)) == 2
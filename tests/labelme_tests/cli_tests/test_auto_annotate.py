@@ -0,0 +1,98 @@
+import json
+import os.path as osp
+import shutil
+
+import numpy as np
+
+from labelme.cli import auto_annotate
+from labelme.label_file import LabelFile
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "../data")
+
+
+class _Model:
+    max_image_size = None
+
+    def __init__(self):
+        self.prompts = []
+
+    def set_image(self, image, original_shape=None):
+        self._image = image
+
+    def wait_image_embedding(self):
+        return np.zeros((1, 256, 64, 64), dtype=np.float32)
+
+    def predict_masks_from_prompts(self, prompts):
+        self.prompts.append(prompts)
+        masks = []
+        for points, _ in prompts:
+            (x1, y1), (x2, y2) = np.asarray(points, dtype=int)
+            mask = np.zeros(self._image.shape[:2], dtype=bool)
+            mask[y1 + 5 : y2 - 5, x1 + 5 : x2 - 5] = True
+            masks.append(mask)
+        return masks
+
+
+def _make_label_file(tmp_path):
+    for ext in [".jpg", ".json"]:
+        shutil.copy(osp.join(data_dir, "annotated/2011_000003" + ext), tmp_path)
+    label_file = str(tmp_path / "2011_000003.json")
+    with open(label_file) as f:
+        data = json.load(f)
+    data["shapes"][0].update(
+        points=[[200, 100], [100, 50]], shape_type="rectangle", group_id=1
+    )
+    with open(label_file, "w") as f:
+        json.dump(data, f)
+    return label_file, data["shapes"]
+
+
+def test_annotate_polygon(tmp_path, monkeypatch):
+    label_file, shapes = _make_label_file(tmp_path)
+    model = _Model()
+
+    num_rectangles, num_shapes, times = auto_annotate.annotate(
+        model, label_file, store_data=False
+    )
+    assert (num_rectangles, num_shapes) == (1, 1)
+    assert list(times) == auto_annotate.STAGES
+    assert model.prompts == [[([[100, 50], [200, 100]], [2, 3])]]
+
+    annotated = LabelFile(label_file)
+    assert [s["shape_type"] for s in annotated.shapes] == ["polygon"] * len(shapes)
+    assert annotated.shapes[0]["label"] == shapes[0]["label"]
+    assert annotated.shapes[0]["group_id"] == 1
+    points = np.array(annotated.shapes[0]["points"])
+    np.testing.assert_allclose(points.min(axis=0), [105, 55], atol=1)
+    np.testing.assert_allclose(points.max(axis=0), [194, 94], atol=1)
+    assert annotated.shapes[1:] == LabelFile(label_file).shapes[1:]
+
+    # no rectangles anymore, for which the image is not loaded
+    def load_image_data(*args, **kwargs):
+        raise AssertionError("image is loaded")
+
+    monkeypatch.setattr(LabelFile, "_load_image_data", load_image_data)
+    assert auto_annotate.annotate(model, label_file)[:2] == (0, 0)
+
+
+def test_annotate_mask(tmp_path):
+    label_file, shapes = _make_label_file(tmp_path)
+    output_file = str(tmp_path / "output" / "2011_000003.json")
+
+    auto_annotate.annotate(
+        _Model(),
+        label_file,
+        output_file=output_file,
+        shape_type="mask",
+        keep_rectangles=True,
+    )
+
+    annotated = LabelFile(output_file)
+    assert annotated.imagePath == osp.join("..", "2011_000003.jpg")
+    assert len(annotated.shapes) == len(shapes) + 1
+    assert annotated.shapes[0]["shape_type"] == "rectangle"
+    assert annotated.shapes[1]["shape_type"] == "mask"
+    assert annotated.shapes[1]["points"] == [[105, 55], [194, 94]]
+    assert annotated.shapes[1]["mask"].shape == (40, 90)
+    assert annotated.shapes[1]["mask"].all()
@@ -0,0 +1,38 @@
+import os.path as osp
+import sys
+
+import numpy as np
+import PIL.Image
+
+from labelme import utils
+from labelme.cli import export_json
+from labelme.label_file import LabelFile
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "../data")
+
+
+def test_export_json_sidecar(tmp_path, monkeypatch):
+    label_file = LabelFile(osp.join(data_dir, "annotated_with_data/apc2016_obj3.json"))
+    json_file = str(tmp_path / "apc2016_obj3.json")
+    label_file.save(
+        filename=json_file,
+        shapes=label_file.shapes,
+        imagePath=label_file.imagePath,
+        imageHeight=label_file.imageHeight,
+        imageWidth=label_file.imageWidth,
+        imageData=label_file.imageData,
+        sidecar=True,
+    )
+
+    out_dir = tmp_path / "out"
+    monkeypatch.setattr(
+        sys, "argv", ["labelme_export_json", json_file, "-o", str(out_dir)]
+    )
+    export_json.main()
+
+    img = np.asarray(PIL.Image.open(out_dir / "img.png"))
+    np.testing.assert_array_equal(img, utils.img_data_to_arr(label_file.imageData))
+    lbl = np.asarray(PIL.Image.open(out_dir / "label.png"))
+    assert lbl.shape == img.shape[:2]
+    assert lbl.max() > 0
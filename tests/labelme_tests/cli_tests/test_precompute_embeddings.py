@@ -0,0 +1,59 @@
+import glob
+import os.path as osp
+import shutil
+import sys
+
+import numpy as np
+
+from labelme.ai.base_model import BaseModel
+from labelme.cli import precompute_embeddings
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "../data")
+
+
+class _EncoderSession:
+    def __init__(self):
+        self.shapes = []
+
+    def run(self, output_names, input_feed):
+        self.shapes.append(input_feed["batched_images"].shape)
+        return [np.zeros((1, 256, 64, 64), dtype=np.float32)]
+
+
+def test_precompute_embeddings(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    image_dir = tmp_path / "images"
+    shutil.copytree(osp.join(data_dir, "raw"), str(image_dir))
+    cache_dir = tmp_path / "cache"
+
+    encoder_session = _EncoderSession()
+    monkeypatch.setattr(
+        BaseModel, "_get_sessions", lambda self: (encoder_session, None)
+    )
+
+    def main():
+        monkeypatch.setattr(
+            sys,
+            "argv",
+            [
+                "labelme_precompute_embeddings",
+                str(image_dir),
+                "--config",
+                "{ai: {embedding_cache: {dir: %s}}}" % cache_dir,
+                "--workers",
+                "2",
+                "--batch-size",
+                "2",
+            ],
+        )
+        precompute_embeddings.main()
+
+    # every embedding is persisted by the time the command exits
+    main()
+    assert len(encoder_session.shapes) == 3
+    assert len(glob.glob(str(cache_dir / "*" / "*.npy"))) == 3
+
+    # and reused
+    main()
+    assert len(encoder_session.shapes) == 3
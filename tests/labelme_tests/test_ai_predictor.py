@@ -0,0 +1,29 @@
+import threading
+
+import pytest
+
+from labelme.ai_predictor import AiPredictor
+
+
+@pytest.mark.gui
+def test_AiPredictor(qtbot):
+    predictor = AiPredictor()
+    started = threading.Event()
+    released = threading.Event()
+
+    def predict(value):
+        started.set()
+        released.wait()
+        return value * 2
+
+    results = []
+    predictor.predicted.connect(lambda key, result: results.append((key, result)))
+
+    predictor.request("a", predict, 1)
+    started.wait()
+    # superseded by the next request while "a" is running
+    predictor.request("b", predict, 2)
+    predictor.request("c", predict, 3)
+    released.set()
+    qtbot.waitUntil(lambda: len(results) == 2)
+    assert results == [("a", 2), ("c", 6)]
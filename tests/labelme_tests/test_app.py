@@ -1,11 +1,15 @@
+import json
 import os.path as osp
 import shutil
 import tempfile
+import threading
 
 import pytest
+from qtpy import QtGui
 
 import labelme.app
 import labelme.config
+import labelme.image_prefetcher
 import labelme.testing
 
 here = osp.dirname(osp.abspath(__file__))
@@ -112,3 +116,84 @@ def test_MainWindow_annotate_jpg(qtbot):
 
     labelme.testing.assert_labelfile_sanity(out_file)
     shutil.rmtree(tmp_dir)
+
+
+@pytest.mark.gui
+def test_MainWindow_saveLabels_checked(qtbot, tmp_path):
+    image_dir = str(tmp_path / "images")
+    shutil.copytree(osp.join(data_dir, "annotated"), image_dir)
+    label_file = osp.join(image_dir, "2011_000003.json")
+    with open(label_file) as f:
+        data = json.load(f)
+    # the image path of the label file differs from the one in the file list
+    data["imagePath"] = "./2011_000003.jpg"
+    with open(label_file, "w") as f:
+        json.dump(data, f)
+
+    win = labelme.app.MainWindow(filename=image_dir)
+    qtbot.addWidget(win)
+    _win_show_and_wait_imageData(qtbot, win)
+    assert win.filename == osp.join(image_dir, "2011_000003.jpg")
+    assert win.imagePath != win.filename
+
+    win.fileListWidget.setChecked(win.filename, False)
+    assert win.saveLabels(label_file)
+    assert win.fileListWidget.isChecked(win.filename)
+    win.close()
+
+
+@pytest.mark.gui
+def test_MainWindow_prefetchNeighborImages_ai(qtbot, monkeypatch):
+    win = create_MainWindow_with_directory(qtbot)
+
+    callbacks = []
+    monkeypatch.setattr(
+        win._imagePrefetcher,
+        "prefetch",
+        lambda items, callback=None: callbacks.append(callback),
+    )
+    threads = []
+    monkeypatch.setattr(
+        win.canvas,
+        "prefetchAiImage",
+        lambda image: threads.append(threading.current_thread()),
+    )
+
+    win.prefetchNeighborImages()
+    assert callbacks == [None]
+
+    win.canvas.setEditing(False)
+    win.canvas.createMode = "ai_polygon"
+    win.prefetchNeighborImages()
+    callback = callbacks[-1]
+    assert callback is not None
+
+    # the callback is called in the threads of the prefetcher
+    loaded = labelme.image_prefetcher.LoadedImage(
+        labelFile=None, imageData=None, imagePath=None, image=QtGui.QImage(), stamp=None
+    )
+    thread = threading.Thread(target=callback, args=(loaded,))
+    thread.start()
+    thread.join()
+    qtbot.waitUntil(lambda: len(threads) > 0)
+    assert threads == [threading.main_thread()]
+    win.close()
+
+
+@pytest.mark.gui
+def test_MainWindow_fileSearchChanged(qtbot, monkeypatch):
+    win = create_MainWindow_with_directory(qtbot)
+
+    waited = []
+    monkeypatch.setattr(
+        labelme.app.ImageScanner, "wait", lambda self, *args: waited.append(self)
+    )
+    win.fileSearch.setText("2011")
+    win.fileSearch.setText("2011_000003")
+    # the cancelled scanner is not waited for in the UI thread
+    assert waited == []
+
+    qtbot.waitUntil(lambda: win._imageScanner is None)
+    assert win.fileListWidget.count() == 1
+    monkeypatch.undo()
+    win.close()
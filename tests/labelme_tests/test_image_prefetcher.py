@@ -0,0 +1,39 @@
+import os.path as osp
+
+from labelme.image_prefetcher import ImagePrefetcher
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "data")
+
+
+def test_ImagePrefetcher(qtbot):
+    img_file = osp.join(data_dir, "annotated/2011_000003.jpg")
+    json_file = osp.join(data_dir, "annotated/2011_000003.json")
+    raw_file = osp.join(data_dir, "raw/2011_000006.jpg")
+
+    prefetcher = ImagePrefetcher()
+    prefetcher.prefetch([(img_file, json_file), (raw_file, None)])
+
+    loaded = prefetcher.get(img_file, json_file)
+    assert loaded.labelFile.filename == json_file
+    assert loaded.imagePath == img_file
+    assert not loaded.image.isNull()
+
+    loaded = prefetcher.get(raw_file)
+    assert loaded.labelFile is None
+    assert loaded.imagePath == raw_file
+    assert (loaded.image.height(), loaded.image.width()) == (375, 500)
+
+    prefetcher.shutdown()
+
+
+def test_ImagePrefetcher_callback(qtbot):
+    raw_file = osp.join(data_dir, "raw/2011_000006.jpg")
+
+    prefetcher = ImagePrefetcher()
+    loaded_images = []
+    prefetcher.prefetch([(raw_file, None)], callback=loaded_images.append)
+    qtbot.waitUntil(lambda: len(loaded_images) == 1)
+    assert loaded_images[0].imagePath == raw_file
+
+    prefetcher.shutdown()
@@ -0,0 +1,33 @@
+import os.path as osp
+
+from labelme.image_scanner import iter_images
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "data")
+
+
+def test_iter_images():
+    images = list(iter_images(data_dir, extensions=[".jpg"]))
+    assert images == [
+        (osp.join(data_dir, "annotated/2011_000003.jpg"), True),
+        (osp.join(data_dir, "annotated/2011_000006.jpg"), True),
+        (osp.join(data_dir, "annotated/2011_000025.jpg"), True),
+        (osp.join(data_dir, "annotated_with_data/apc2016_obj3.jpg"), True),
+        (osp.join(data_dir, "raw/2011_000003.jpg"), False),
+        (osp.join(data_dir, "raw/2011_000006.jpg"), False),
+        (osp.join(data_dir, "raw/2011_000025.jpg"), False),
+    ]
+
+    images = list(
+        iter_images(
+            data_dir,
+            extensions=[".jpg"],
+            output_dir=osp.join(data_dir, "annotated"),
+            pattern="raw",
+        )
+    )
+    assert images == [
+        (osp.join(data_dir, "raw/2011_000003.jpg"), True),
+        (osp.join(data_dir, "raw/2011_000006.jpg"), True),
+        (osp.join(data_dir, "raw/2011_000025.jpg"), True),
+    ]
@@ -0,0 +1,281 @@
+import json
+import os
+import os.path as osp
+import shutil
+import tempfile
+
+import numpy as np
+import PIL.Image
+import pytest
+
+import labelme.label_file
+from labelme import utils
+from labelme.label_file import LabelFile
+from labelme.label_file import LabelFileError
+
+here = osp.dirname(osp.abspath(__file__))
+data_dir = osp.join(here, "data")
+
+
+def test_LabelFile_load_image_false():
+    json_files = [
+        osp.join(data_dir, "annotated_with_data/apc2016_obj3.json"),
+        osp.join(data_dir, "annotated/2011_000003.json"),
+    ]
+    for json_file in json_files:
+        label_file = LabelFile(json_file)
+        label_file_meta = LabelFile(json_file, load_image=False)
+
+        assert label_file_meta._imageData is None
+        assert label_file_meta.shapes == label_file.shapes
+        assert label_file_meta.flags == label_file.flags
+        assert label_file_meta.imageHeight == label_file.imageHeight
+        assert label_file_meta.imageWidth == label_file.imageWidth
+        assert label_file_meta.imageData == label_file.imageData
+
+
+def test_LabelFile_load_meta():
+    json_file = osp.join(data_dir, "annotated_with_data/apc2016_obj3.json")
+    label_file = LabelFile()
+    label_file.load_meta(json_file)
+    assert label_file.filename == json_file
+    assert (label_file.imageHeight, label_file.imageWidth) == (907, 1210)
+    assert label_file._imageData is None
+    assert label_file.imageData is not None
+
+
+def test_LabelFile_load_image_false_missing_image(tmp_path):
+    json_file = str(tmp_path / "2011_000003.json")
+    shutil.copy(osp.join(data_dir, "annotated/2011_000003.json"), json_file)
+
+    # the image size is of the JSON, and the image is required only for imageData
+    label_file = LabelFile(json_file, load_image=False)
+    assert (label_file.imageHeight, label_file.imageWidth) == (338, 500)
+    assert len(label_file.shapes) > 0
+    with pytest.raises(LabelFileError):
+        label_file.imageData
+
+    with pytest.raises(LabelFileError):
+        LabelFile(json_file)
+
+
+def test_LabelFile_read_image_file():
+    img_file = osp.join(data_dir, "raw/2011_000003.jpg")
+    imageData, image_arr = LabelFile.read_image_file(img_file)
+    with open(img_file, "rb") as f:
+        assert imageData == f.read()
+    assert image_arr is None
+
+
+def test_LabelFile_read_image_file_bmp(tmp_path):
+    img = np.asarray(PIL.Image.open(osp.join(data_dir, "raw/2011_000003.jpg")))
+    img_file = str(tmp_path / "2011_000003.bmp")
+    PIL.Image.fromarray(img).save(img_file)
+
+    # re-encoded as PNG instead of the raw BMP
+    imageData, image_arr = LabelFile.read_image_file(img_file)
+    assert imageData.startswith(b"\x89PNG")
+    assert len(imageData) < osp.getsize(img_file)
+    np.testing.assert_array_equal(image_arr, img)
+    np.testing.assert_array_equal(utils.img_data_to_arr(imageData), img)
+
+
+def test_LabelFile_save():
+    json_file = osp.join(data_dir, "annotated_with_data/apc2016_obj3.json")
+    label_file = LabelFile(json_file)
+
+    tmp_dir = tempfile.mkdtemp()
+    out_file = osp.join(tmp_dir, "apc2016_obj3.json")
+    label_file.save(
+        filename=out_file,
+        shapes=label_file.shapes,
+        imagePath=label_file.imagePath,
+        imageHeight=None,
+        imageWidth=None,
+        imageData=label_file.imageData,
+        otherData=label_file.otherData,
+        flags=label_file.flags,
+    )
+    assert os.listdir(tmp_dir) == ["apc2016_obj3.json"]
+
+    with open(json_file) as f:
+        data = json.load(f)
+    with open(out_file) as f:
+        data_saved = json.load(f)
+    assert data_saved["imageData"] == data["imageData"]
+    assert data_saved["imageHeight"] == data["imageHeight"]
+    assert data_saved["imageWidth"] == data["imageWidth"]
+    shutil.rmtree(tmp_dir)
+
+
+def test_LabelFile_save_fsync(tmp_path, monkeypatch):
+    label_file = LabelFile(osp.join(data_dir, "annotated_with_data/apc2016_obj3.json"))
+    out_file = str(tmp_path / "apc2016_obj3.json")
+
+    calls = []
+    fsync = os.fsync
+    replace = os.replace
+
+    def fsync_(fd):
+        calls.append("fsync")
+        fsync(fd)
+
+    def replace_(src, dst):
+        calls.append("replace")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "fsync", fsync_)
+    monkeypatch.setattr(os, "replace", replace_)
+    label_file.save(
+        filename=out_file,
+        shapes=label_file.shapes,
+        imagePath=label_file.imagePath,
+        imageHeight=label_file.imageHeight,
+        imageWidth=label_file.imageWidth,
+        imageData=label_file.imageData,
+        sidecar=True,
+    )
+    # the sidecar and label files are synced before the rename, and the
+    # directory after that where supported
+    assert calls[:3] == ["fsync", "fsync", "replace"]
+
+
+def _get_sidecar_file(dirname):
+    (sidecar_file,) = [
+        filename
+        for filename in os.listdir(dirname)
+        if filename.endswith(LabelFile.sidecar_suffix)
+    ]
+    return sidecar_file
+
+
+def test_LabelFile_save_sidecar():
+    json_file = osp.join(data_dir, "annotated_with_data/apc2016_obj3.json")
+    label_file = LabelFile(json_file)
+    mask = np.zeros((20, 30), dtype=bool)
+    mask[5:10, 3:17] = True
+    shapes = label_file.shapes + [
+        dict(
+            label="mask",
+            points=[[0, 0], [29, 19]],
+            shape_type="mask",
+            flags={},
+            group_id=None,
+            description=None,
+            mask=mask,
+        )
+    ]
+
+    tmp_dir = tempfile.mkdtemp()
+    out_file = osp.join(tmp_dir, "apc2016_obj3.json")
+    label_file.save(
+        filename=out_file,
+        shapes=shapes,
+        imagePath=label_file.imagePath,
+        imageHeight=label_file.imageHeight,
+        imageWidth=label_file.imageWidth,
+        imageData=label_file.imageData,
+        sidecar=True,
+    )
+    sidecar_file = _get_sidecar_file(tmp_dir)
+    assert sorted(os.listdir(tmp_dir)) == sorted(["apc2016_obj3.json", sidecar_file])
+    assert sidecar_file.startswith("apc2016_obj3.")
+    with open(out_file) as f:
+        data = json.load(f)
+    assert isinstance(data["imageData"], dict)
+    assert isinstance(data["shapes"][-1]["mask"], dict)
+
+    for load_image in [True, False]:
+        label_file_saved = LabelFile(out_file, load_image=load_image)
+        assert label_file_saved.imageData == label_file.imageData
+        assert label_file_saved.imageHeight == label_file.imageHeight
+        assert label_file_saved.imageWidth == label_file.imageWidth
+        np.testing.assert_array_equal(label_file_saved.shapes[-1]["mask"], mask)
+    shutil.rmtree(tmp_dir)
+
+
+def test_LabelFile_save_sidecar_replace(monkeypatch):
+    json_file = osp.join(data_dir, "annotated_with_data/apc2016_obj3.json")
+    label_file = LabelFile(json_file)
+    kwargs = dict(
+        shapes=label_file.shapes,
+        imagePath=label_file.imagePath,
+        imageHeight=label_file.imageHeight,
+        imageWidth=label_file.imageWidth,
+        imageData=label_file.imageData,
+    )
+
+    tmp_dir = tempfile.mkdtemp()
+    out_file = osp.join(tmp_dir, "apc2016_obj3.json")
+    label_file.save(filename=out_file, sidecar=True, **kwargs)
+    sidecar_file = _get_sidecar_file(tmp_dir)
+
+    # a new sidecar file replaces the previous one
+    label_file.save(filename=out_file, sidecar=True, **kwargs)
+    assert len(os.listdir(tmp_dir)) == 2
+    assert _get_sidecar_file(tmp_dir) != sidecar_file
+    sidecar_file = _get_sidecar_file(tmp_dir)
+
+    # the previous label file is kept if failed to write the label file
+    def _dump_json(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    with monkeypatch.context() as m:
+        m.setattr(labelme.label_file, "_dump_json", _dump_json)
+        with pytest.raises(LabelFileError):
+            label_file.save(filename=out_file, sidecar=True, **kwargs)
+    assert sorted(os.listdir(tmp_dir)) == sorted(["apc2016_obj3.json", sidecar_file])
+    assert LabelFile(out_file).imageData == label_file.imageData
+
+    # the sidecar file is removed when no longer used
+    label_file.save(filename=out_file, sidecar=False, **kwargs)
+    assert os.listdir(tmp_dir) == ["apc2016_obj3.json"]
+    assert LabelFile(out_file).imageData == label_file.imageData
+    shutil.rmtree(tmp_dir)
+
+
+def test_LabelFile_save_sidecar_roundtrip(tmp_path):
+    label_file = LabelFile(osp.join(data_dir, "annotated_with_data/apc2016_obj3.json"))
+    mask = np.zeros((20, 30), dtype=bool)
+    mask[5:10, 3:17] = True
+    out_file = str(tmp_path / "apc2016_obj3.json")
+    label_file.save(
+        filename=out_file,
+        shapes=[
+            dict(
+                label="mask",
+                points=[[0, 0], [29, 19]],
+                shape_type="mask",
+                flags={},
+                group_id=None,
+                description=None,
+                mask=mask,
+            )
+        ],
+        imagePath=label_file.imagePath,
+        imageHeight=label_file.imageHeight,
+        imageWidth=label_file.imageWidth,
+        imageData=label_file.imageData,
+        sidecar=True,
+    )
+
+    # saved again from the metadata, and from the references in the JSON
+    for from_json in [False, True]:
+        loaded = LabelFile(out_file, load_image=False)
+        shapes = loaded.shapes
+        if from_json:
+            with open(out_file) as f:
+                shapes = json.load(f)["shapes"]
+        label_file.save(
+            filename=out_file,
+            shapes=shapes,
+            imagePath=loaded.imagePath,
+            imageHeight=loaded.imageHeight,
+            imageWidth=loaded.imageWidth,
+            imageData=loaded.imageData,
+            sidecar=True,
+        )
+        assert len(os.listdir(str(tmp_path))) == 2
+        saved = LabelFile(out_file)
+        assert saved.imageData == label_file.imageData
+        np.testing.assert_array_equal(saved.shapes[0]["mask"], mask)
@@ -0,0 +1,127 @@
+import numpy as np
+from qtpy import QtCore
+from qtpy import QtGui
+
+from labelme.shape import Shape
+
+
+def _paint(shape):
+    image = QtGui.QImage(40, 30, QtGui.QImage.Format_ARGB32)
+    image.fill(QtGui.QColor(0, 0, 0, 255))
+    painter = QtGui.QPainter(image)
+    shape.paint(painter)
+    painter.end()
+    return image
+
+
+def test_Shape_paint_mask():
+    mask = np.zeros((10, 20), dtype=bool)
+    mask[2:8, 5:15] = True
+    shape = Shape(shape_type="mask", mask=mask)
+    shape.points = [QtCore.QPointF(10, 10), QtCore.QPointF(29, 19)]
+    shape.line_color = QtGui.QColor(0, 255, 0, 128)
+    shape.fill_color = QtGui.QColor(255, 0, 0, 255)
+    shape.select_line_color = QtGui.QColor(255, 255, 255, 255)
+    shape.select_fill_color = QtGui.QColor(0, 0, 255, 255)
+
+    image = _paint(shape)
+    assert image.pixelColor(20, 15) == QtGui.QColor(255, 0, 0, 255)
+    assert image.pixelColor(5, 5) == QtGui.QColor(0, 0, 0, 255)
+    mask_image = shape._mask_image
+    mask_outline = shape._mask_outline
+
+    # cached
+    _paint(shape)
+    assert shape._mask_image is mask_image
+    assert shape._mask_outline is mask_outline
+
+    # the fill color is changed, but not the outline
+    shape.selected = True
+    assert _paint(shape).pixelColor(20, 15) == QtGui.QColor(0, 0, 255, 255)
+    assert shape._mask_image is not mask_image
+    assert shape._mask_outline is mask_outline
+
+    copied = shape.copy()
+    assert copied._mask_image is None
+    np.testing.assert_array_equal(copied.mask, mask)
+
+    shape.mask = ~mask
+    assert shape._mask_image is None and shape._mask_outline is None
+    assert _paint(shape).pixelColor(20, 15) == QtGui.QColor(0, 0, 0, 255)
+
+
+def test_Shape_geometry_cache():
+    shape = Shape(shape_type="polygon")
+    for x, y in [(0, 0), (10, 0), (10, 10)]:
+        shape.addPoint(QtCore.QPointF(x, y))
+    shape.close()
+
+    path = shape.makePath()
+    assert shape.makePath() is path
+    assert shape.containsPoint(QtCore.QPointF(8, 2))
+    assert shape.boundingRect() == QtCore.QRectF(0, 0, 10, 10)
+
+    shape.moveVertexBy(2, QtCore.QPointF(10, 0))
+    assert shape.makePath() is not path
+    assert shape.boundingRect() == QtCore.QRectF(0, 0, 20, 10)
+
+    shape.moveBy(QtCore.QPointF(5, 5))
+    assert shape.boundingRect() == QtCore.QRectF(5, 5, 20, 10)
+
+    shape.insertPoint(1, QtCore.QPointF(10, -5))
+    assert shape.boundingRect() == QtCore.QRectF(5, -5, 20, 20)
+
+    shape.removePoint(1)
+    shape[0] = QtCore.QPointF(0, 5)
+    assert shape.boundingRect() == QtCore.QRectF(0, 5, 25, 10)
+    assert not shape.containsPoint(QtCore.QPointF(8, 2))
+
+    copied = shape.copy()
+    copied.moveBy(QtCore.QPointF(100, 0))
+    assert copied.boundingRect() == QtCore.QRectF(100, 5, 25, 10)
+    assert shape.boundingRect() == QtCore.QRectF(0, 5, 25, 10)
+
+
+def test_Shape_nearest_vertex_and_edge():
+    shape = Shape(shape_type="polygon")
+    for x, y in [(0, 0), (10, 0), (10, 10), (0, 10)]:
+        shape.addPoint(QtCore.QPointF(x, y))
+
+    assert shape.nearestVertex(QtCore.QPointF(9, 1), epsilon=2) == 1
+    assert shape.nearestVertex(QtCore.QPointF(5, 5), epsilon=2) is None
+    # edge i is from vertex i - 1 to vertex i
+    assert shape.nearestEdge(QtCore.QPointF(5, 1), epsilon=2) == 1
+    assert shape.nearestEdge(QtCore.QPointF(-1, 5), epsilon=2) == 0
+    assert shape.nearestEdge(QtCore.QPointF(12, 12), epsilon=2) is None
+    # the nearest end is out of epsilon though the line is near
+    assert shape.nearestEdge(QtCore.QPointF(13, -1), epsilon=2) is None
+
+    # the points array follows the moved vertex
+    shape.moveVertexBy(1, QtCore.QPointF(10, 0))
+    assert shape.nearestVertex(QtCore.QPointF(9, 1), epsilon=2) is None
+    assert shape.nearestVertex(QtCore.QPointF(19, 1), epsilon=2) == 1
+
+    assert Shape().nearestVertex(QtCore.QPointF(0, 0), epsilon=2) is None
+    assert Shape().nearestEdge(QtCore.QPointF(0, 0), epsilon=2) is None
+
+
+def test_Shape_paint_simplified():
+    shape = Shape(shape_type="polygon")
+    for i in range(100):
+        # points on a line, which are simplified to its ends
+        shape.addPoint(QtCore.QPointF(5 + i * 0.3, 5 + i * 0.2))
+    shape.addPoint(QtCore.QPointF(5, 25))
+    shape.close()
+    shape.line_color = QtGui.QColor(0, 255, 0, 255)
+    shape.vertex_fill_color = QtGui.QColor(255, 0, 0, 255)
+
+    image = QtGui.QImage(40, 30, QtGui.QImage.Format_ARGB32)
+    image.fill(QtGui.QColor(0, 0, 0, 255))
+    painter = QtGui.QPainter(image)
+    shape.paint(painter, simplified=True)
+    painter.end()
+
+    assert shape._cache["simplified_line_path"][1].elementCount() == 4
+    # no vertex is drawn
+    assert image.pixelColor(5, 25) != QtGui.QColor(255, 0, 0, 255)
+    assert _paint(shape).pixelColor(5, 25) == QtGui.QColor(255, 0, 0, 255)
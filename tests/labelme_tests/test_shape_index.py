@@ -0,0 +1,60 @@
+from qtpy import QtCore
+
+from labelme.shape import Shape
+from labelme.shape_index import ShapeIndex
+
+
+def _rectangle(x1, y1, x2, y2):
+    shape = Shape(shape_type="rectangle")
+    shape.addPoint(QtCore.QPointF(x1, y1))
+    shape.addPoint(QtCore.QPointF(x2, y2))
+    return shape
+
+
+def test_ShapeIndex():
+    shape1 = _rectangle(10, 10, 50, 50)
+    shape2 = _rectangle(30, 30, 100, 100)
+    large = _rectangle(0, 0, 10000, 10000)
+    shapes = [large, shape1, shape2]
+
+    index = ShapeIndex(cell_size=16, max_cells=64)
+    index.update(shapes)
+    assert len(index) == 3
+    assert index._large == {id(large)}
+
+    # ordered from the last shape
+    assert index.query(40, 40) == [shape2, shape1, large]
+    assert index.query(20, 20) == [shape1, large]
+    assert index.query(5000, 5000) == [large]
+    assert index.query(-5, -5) == []
+    assert index.query(-5, -5, margin=20) == [shape1, large]
+
+    # only the moved shape is re-indexed
+    entry = index._entries[id(shape2)]
+    shape1.moveBy(QtCore.QPointF(1000, 0))
+    index.update(shapes)
+    assert index._entries[id(shape2)] is entry
+    assert index.query(20, 20) == [large]
+    assert index.query(1020, 20) == [shape1, large]
+
+    shapes.remove(shape1)
+    index.update(shapes)
+    assert len(index) == 2
+    assert index.query(1020, 20) == [large]
+    assert all(id(shape1) not in keys for keys in index._cells.values())
+
+
+def test_ShapeIndex_refresh():
+    shape1 = _rectangle(10, 10, 50, 50)
+    shape2 = _rectangle(30, 30, 100, 100)
+    index = ShapeIndex(cell_size=16)
+    index.update([shape1, shape2])
+
+    entry = index._entries[id(shape2)]
+    shape1.moveVertexBy(1, QtCore.QPointF(100, 100))
+    # shapes not indexed are ignored
+    index.refresh([shape1, shape2, _rectangle(0, 0, 10, 10)])
+    assert len(index) == 2
+    assert index._entries[id(shape2)] is entry
+    assert index.query(120, 120) == [shape1]
+    assert index.query(40, 40) == [shape2, shape1]
@@ -0,0 +1,151 @@
+from qtpy import QtCore
+from qtpy import QtGui
+from qtpy import QtWidgets
+
+from labelme.shape import Shape
+from labelme.widgets.canvas import Canvas
+
+
+def test_Canvas_paint_exposed(qtbot, monkeypatch):
+    canvas = Canvas()
+    pixmap = QtGui.QPixmap(1000, 1000)
+    pixmap.fill(QtGui.QColor(0, 0, 0))
+    canvas.loadPixmap(pixmap)
+    shapes = []
+    for x in range(0, 1000, 100):
+        for y in range(0, 1000, 100):
+            shape = Shape(shape_type="rectangle")
+            shape.addPoint(QtCore.QPointF(x + 10, y + 10))
+            shape.addPoint(QtCore.QPointF(x + 90, y + 90))
+            shapes.append(shape)
+    canvas.loadShapes(shapes)
+    canvas.adjustSize()
+
+    scroll_area = QtWidgets.QScrollArea()
+    scroll_area.setWidget(canvas)
+    scroll_area.resize(200, 200)
+    qtbot.addWidget(scroll_area)
+    scroll_area.show()
+    qtbot.waitExposed(scroll_area)
+
+    painted = []
+    monkeypatch.setattr(
+        Shape,
+        "paint",
+        lambda shape, painter, simplified=False: painted.append((shape, simplified)),
+    )
+
+    # only the shapes in the viewport
+    canvas.update()
+    qtbot.waitUntil(lambda: len(painted) > 0)
+    assert 0 < len(painted) < 10
+    assert shapes[0] in [shape for shape, _ in painted]
+    assert not any(simplified for _, simplified in painted)
+
+    # simplified while panning, and in full detail after that
+    del painted[:]
+    scroll_area.horizontalScrollBar().setValue(500)
+    qtbot.waitUntil(lambda: len(painted) > 0)
+    assert shapes[0] not in [shape for shape, _ in painted]
+    assert all(simplified for _, simplified in painted)
+    del painted[:]
+    qtbot.waitUntil(lambda: len(painted) > 0 and not painted[-1][1])
+
+
+def test_Canvas_move_after_reset(qtbot):
+    canvas = Canvas()
+    pixmap = QtGui.QPixmap(1000, 1000)
+    pixmap.fill(QtGui.QColor(0, 0, 0))
+    canvas.loadPixmap(pixmap)
+    canvas.adjustSize()
+
+    scroll_area = QtWidgets.QScrollArea()
+    scroll_area.setWidget(canvas)
+    scroll_area.resize(200, 200)
+    qtbot.addWidget(scroll_area)
+    scroll_area.show()
+    qtbot.waitExposed(scroll_area)
+    qtbot.waitUntil(lambda: canvas._paintedView is not None)
+
+    # the image is closed after panning, and the canvas is moved again
+    scroll_area.horizontalScrollBar().setValue(500)
+    canvas.resetState()
+    assert canvas._paintedView is None
+    canvas.move(0, 0)
+    canvas._startInteraction()
+    assert not canvas._interactionTimer.isActive()
+
+
+def test_Canvas_shape_index(qtbot, monkeypatch):
+    canvas = Canvas()
+    qtbot.addWidget(canvas)
+    pixmap = QtGui.QPixmap(1000, 1000)
+    canvas.loadPixmap(pixmap)
+    shapes = []
+    for x in range(0, 1000, 100):
+        shape = Shape(shape_type="rectangle")
+        shape.addPoint(QtCore.QPointF(x + 10, 10))
+        shape.addPoint(QtCore.QPointF(x + 90, 90))
+        shapes.append(shape)
+    canvas.loadShapes(shapes)
+    assert canvas._shapesAt(QtCore.QPointF(50, 50)) == [shapes[0]]
+
+    # not re-indexed by hit-testing
+    updated = []
+    monkeypatch.setattr(
+        canvas._shapeIndex, "update", lambda shapes: updated.append(shapes)
+    )
+    canvas.hVertex, canvas.hShape = 1, shapes[0]
+    canvas.boundedMoveVertex(QtCore.QPointF(150, 150))
+    canvas.selectedShapes = [shapes[1]]
+    canvas.prevPoint = QtCore.QPointF(150, 50)
+    canvas.offsets = QtCore.QPointF(), QtCore.QPointF()
+    canvas.boundedMoveShapes(canvas.selectedShapes, QtCore.QPointF(150, 550))
+    assert canvas._shapesAt(QtCore.QPointF(120, 120)) == [shapes[0]]
+    assert canvas._shapesAt(QtCore.QPointF(150, 550)) == [shapes[1]]
+    assert canvas._shapesAt(QtCore.QPointF(180, 50)) == []
+    assert updated == []
+    monkeypatch.undo()
+
+    canvas.deleteShape(shapes[0])
+    assert canvas._shapesAt(QtCore.QPointF(50, 50)) == []
+
+
+def test_Canvas_end_move(qtbot, monkeypatch):
+    canvas = Canvas()
+    pixmap = QtGui.QPixmap(1000, 1000)
+    pixmap.fill(QtGui.QColor(0, 0, 0))
+    canvas.loadPixmap(pixmap)
+    shape = Shape(shape_type="rectangle")
+    shape.addPoint(QtCore.QPointF(10, 10))
+    shape.addPoint(QtCore.QPointF(90, 90))
+    canvas.loadShapes([shape])
+    painted = []
+    monkeypatch.setattr(
+        Shape,
+        "paint",
+        lambda shape, painter, simplified=False: painted.append(shape),
+    )
+    canvas.resize(1000, 1000)
+    qtbot.addWidget(canvas)
+    canvas.show()
+    qtbot.waitUntil(lambda: len(painted) > 0)
+
+    # copied and moved to other cells of the index
+    canvas.selectedShapes = [shape]
+    copied = shape.copy()
+    copied.moveBy(QtCore.QPointF(500, 500))
+    canvas.selectedShapesCopy = [copied]
+    del painted[:]
+    canvas.endMove(copy=True)
+    assert canvas._shapeIndex.query_rect(500, 500, 600, 600) == [copied]
+    assert copied in painted
+
+    moved = shape.copy()
+    moved.moveBy(QtCore.QPointF(800, 0))
+    canvas.selectedShapes = [shape]
+    canvas.selectedShapesCopy = [moved]
+    del painted[:]
+    canvas.endMove(copy=False)
+    assert canvas._shapeIndex.query_rect(800, 0, 900, 100) == [shape]
+    assert shape in painted
@@ -0,0 +1,32 @@
+import pytest
+from qtpy.QtCore import Qt
+
+from labelme.widgets import FileListWidget
+
+
+@pytest.mark.gui
+def test_FileListWidget(qtbot):
+    widget = FileListWidget(is_checked=lambda filename: filename == "c.jpg")
+    qtbot.addWidget(widget)
+
+    widget.addFiles(["a.jpg", "b.jpg"], checked=[True, False])
+    widget.addFiles(["b.jpg", "c.jpg"])
+    assert widget.filenames() == ["a.jpg", "b.jpg", "c.jpg"]
+    assert widget.indexOf("c.jpg") == 2
+    assert widget.indexOf("d.jpg") == -1
+
+    model = widget.model()
+    assert model.data(model.index(0), Qt.CheckStateRole) == Qt.Checked
+    assert model.data(model.index(1), Qt.CheckStateRole) == Qt.Unchecked
+    assert model.data(model.index(2), Qt.CheckStateRole) == Qt.Checked
+    widget.setChecked("b.jpg", True)
+    assert widget.isChecked("b.jpg")
+
+    with qtbot.waitSignal(widget.itemSelectionChanged):
+        widget.setCurrentRow(1)
+    assert widget.currentRow() == 1
+    assert widget.selectedFilenames() == ["b.jpg"]
+
+    widget.clear()
+    assert len(widget) == 0
+    assert widget.indexOf("a.jpg") == -1